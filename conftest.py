@@ -0,0 +1,13 @@
+"""
+Pytest configuration for the Geneva project.
+
+Provides dummy values for the critical environment variables so that
+`src.config.validate_config()` does not abort the interpreter when the
+test suite imports application modules.
+"""
+import os
+
+os.environ.setdefault('MODERATOR_BOT_TOKEN', 'test-moderator-token')
+os.environ.setdefault('HUNTER_BOT_TOKEN', 'test-hunter-token')
+os.environ.setdefault('CHANNEL_ID', 'test-channel')
+os.environ.setdefault('ADMIN_ID', 'test-admin')
@@ -8,29 +8,97 @@ from typing import List
 from src.config import logger, DB_PATH, validate_config
 validate_config()
 
-from src.database import init_db
-from src.bots.utils import hunter_bot, moderator_bot
-from src.bots.hunter import register_hunter_handlers
+from src.database import init_db, close_db
+from src.bots.utils import hunter_bot, moderator_bot, init_tg_session, close_tg_session
+from src.bots.hunter import register_hunter_handlers, admin_notifier_worker
 from src.bots.moderator import register_moderator_handlers
 from src.web.routes import setup_routes
-from src.web.middleware import logging_middleware, error_handling_middleware
+from src.web.handlers import notification_worker
+from src.web.webhooks import use_webhooks, HUNTER_WEBHOOK_PATH, MODERATOR_WEBHOOK_PATH
+from src.config import DOMAIN_NAME
+from src.web.middleware import request_middleware
 
 
 async def start_bots(app: web.Application):
-    """Регистрирует хендлеры и запускает long-polling для ботов."""
+    """Регистрирует хендлеры и запускает транспорт ботов (webhook или polling)."""
     logger.info("Регистрация обработчиков ботов...")
     register_hunter_handlers()
     register_moderator_handlers()
 
+    # Общая keep-alive HTTP-сессия для скачивания файлов из Bot API
+    await init_tg_session()
+
+    # Агрегатор уведомлений администратору о новых заявках
+    app['admin_notify_task'] = asyncio.create_task(admin_notifier_worker())
+
+    if use_webhooks():
+        # Telegram сам доставляет апдейты на наш aiohttp-сервер: нет
+        # холостых polling-запросов и апдейты обрабатываются конкурентно.
+        logger.info("Запуск ботов в режиме webhook...")
+        await hunter_bot.remove_webhook()
+        await hunter_bot.set_webhook(url=f"https://{DOMAIN_NAME}{HUNTER_WEBHOOK_PATH}")
+        await moderator_bot.remove_webhook()
+        await moderator_bot.set_webhook(url=f"https://{DOMAIN_NAME}{MODERATOR_WEBHOOK_PATH}")
+        return
+
+    # Для локальной разработки (без публичного HTTPS-домена) остается polling.
     logger.info("Запуск ботов в режиме polling...")
     # Store polling tasks to be able to cancel them later
     app['bot_tasks'] = [
         asyncio.create_task(hunter_bot.polling(non_stop=True, request_timeout=90)),
         asyncio.create_task(moderator_bot.polling(non_stop=True, request_timeout=90))
     ]
+    for task in app['bot_tasks']:
+        task.add_done_callback(_log_unexpected_task_exit)
+
+
+def _log_unexpected_task_exit(task: asyncio.Task) -> None:
+    """Логирует неожиданное завершение polling-задачи (кроме отмены)."""
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.error(f"Polling-задача завершилась с ошибкой: {exc!r}")
+
+async def start_notification_worker(app: web.Application):
+    """Запускает фоновую задачу отправки уведомлений пользователям."""
+    app['notify_task'] = asyncio.create_task(notification_worker())
+
+
+async def stop_notification_worker(app: web.Application):
+    """Останавливает фоновую задачу отправки уведомлений."""
+    task = app.get('notify_task')
+    if task:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def close_http_session(app: web.Application):
+    """Закрывает общую HTTP-сессию для Bot API."""
+    await close_tg_session()
+
+
+async def close_database(app: web.Application):
+    """Закрывает общее соединение с базой данных."""
+    await close_db()
+
 
 async def stop_bots(app: web.Application):
-    """Останавливает long-polling для ботов."""
+    """Останавливает транспорт ботов (снимает вебхуки или гасит polling)."""
+    task = app.get('admin_notify_task')
+    if task:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    if use_webhooks():
+        logger.info("Снятие вебхуков ботов...")
+        for bot in (hunter_bot, moderator_bot):
+            try:
+                await bot.remove_webhook()
+            except Exception as e:
+                logger.warning(f"Не удалось снять вебхук: {e}")
+        return
+
     logger.info("Остановка задач опроса ботов...")
     if 'bot_tasks' in app:
         for task in app['bot_tasks']:
@@ -49,44 +117,52 @@ async def main():
     await init_db()
 
     # Создаем веб-приложение с мидлварями
-    app = web.Application(middlewares=[logging_middleware, error_handling_middleware])
+    app = web.Application(middlewares=[request_middleware])
 
-    # Настраиваем обработчики сигналов для корректного завершения
+    # Настраиваем обработчики сигналов для корректного завершения:
+    # сигнал просто взводит событие, главный цикл ждет его ниже.
+    shutdown_event = asyncio.Event()
     loop = asyncio.get_running_loop()
     for sig in (signal.SIGINT, signal.SIGTERM):
-        loop.add_signal_handler(sig, lambda: asyncio.create_task(graceful_shutdown(app)))
+        loop.add_signal_handler(sig, shutdown_event.set)
 
     # Привязываем запуск и остановку ботов к жизненному циклу веб-приложения
     app.on_startup.append(start_bots)
+    app.on_startup.append(start_notification_worker)
+    app.on_cleanup.append(stop_notification_worker)
     app.on_cleanup.append(stop_bots)
+    app.on_cleanup.append(close_http_session)
+    app.on_cleanup.append(close_database)
 
     # Настраиваем и запускаем веб-сервер
     setup_routes(app)
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', 8080)
+    # reuse_port (SO_REUSEPORT) позволяет при необходимости запустить
+    # несколько экземпляров процесса на одном порту — ядро само
+    # распределит соединения между ними.
+    site = web.TCPSite(runner, '0.0.0.0', 8080, reuse_port=True)
 
     logger.info("Веб-сервер 'Женева' запущен на http://0.0.0.0:8080")
     await site.start()
 
-    # Поддерживаем работу сервера
-    await asyncio.Event().wait()
-
-
-async def graceful_shutdown(app: web.Application):
-    """Координация корректного завершения работы."""
-    logger.info("Получен сигнал остановки, начинаю корректное завершение...")
-    # Остановка ботов уже будет вызвана через on_cleanup
-    # Главный цикл завершится, когда веб-сервер остановится
-    # Достаточно остановить основной Event, чтобы главный 'main' цикл завершился
-    # и позволил выполниться cleanup операциям.
-    # Найдем и отмним задачу, которая ждет Event
-    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
-    for task in tasks:
-        if "wait" in str(task): # Не очень надежный способ, но для этого случая сработает
-             task.cancel()
+    # Работаем до сигнала остановки, затем гарантированно выполняем
+    # cleanup-хуки (остановка ботов, закрытие БД) через runner.cleanup().
+    try:
+        await shutdown_event.wait()
+        logger.info("Получен сигнал остановки, начинаю корректное завершение...")
+    finally:
+        await runner.cleanup()
 
 if __name__ == '__main__':
+    try:
+        # uvloop заметно ускоряет все операции с сокетами; приложение
+        # работает и без него, на стандартном цикле событий.
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, asyncio.CancelledError):
@@ -5,45 +5,197 @@ This module contains all the Telegram bot handlers for the user-facing
 workflow, which includes submitting new rental offers and requests.
 It uses a state machine pattern to guide the user through the process.
 """
+import asyncio
+import time
 from datetime import datetime
 from telebot.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
-from .utils import hunter_bot, moderator_bot
+from .utils import hunter_bot, moderator_bot, new_submission_id
 from src import database as db
 from src.config import SUBMISSION_COOLDOWN, ADMIN_ID, DOMAIN_NAME, logger
+from src.web import cache as api_cache
+
+# Fixed prompts and the start menu are the same for every user; building
+# them once at import time skips the per-message string/markup rebuilds.
+_START_TEXT = (
+    "Здравствуйте! Я помогу вам сдать или найти жильё в Мелитополе.\n\n"
+    "Что вы хотите сделать?"
+)
+_START_MARKUP = InlineKeyboardMarkup(row_width=1)
+_START_MARKUP.add(InlineKeyboardButton('🏠 Сдать жильё', callback_data='action_offer'))
+_START_MARKUP.add(InlineKeyboardButton('🔍 Ищу жильё', callback_data='action_request'))
+
+_OFFER_TYPE_MARKUP = InlineKeyboardMarkup(row_width=2)
+_OFFER_TYPE_MARKUP.add(
+    InlineKeyboardButton('🗓 На долгий срок', callback_data='type_long_term'),
+    InlineKeyboardButton('☀️ Посуточно', callback_data='type_daily')
+)
+
+_PHOTOS_CONTINUE_MARKUP = InlineKeyboardMarkup(row_width=2)
+_PHOTOS_CONTINUE_MARKUP.add(
+    InlineKeyboardButton("➕ Добавить еще", callback_data="add_more_photos"),
+    InlineKeyboardButton("✅ Завершить", callback_data="photos_done")
+)
+
+_PHOTOS_DONE_MARKUP = InlineKeyboardMarkup()
+_PHOTOS_DONE_MARKUP.add(InlineKeyboardButton("✅ Завершить", callback_data="photos_done"))
+
+_ADMIN_PANEL_MARKUP = InlineKeyboardMarkup()
+_ADMIN_PANEL_MARKUP.add(InlineKeyboardButton("Перейти в админ-панель", url=f"http://{DOMAIN_NAME}/admin"))
+
+# Admin notifications are aggregated over a short window so a burst of
+# submissions produces one "X new submissions" message instead of one
+# Telegram round-trip per submission.
+_ADMIN_NOTIFY_WINDOW = 0.5
+_admin_notify_queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+
+
+async def admin_notifier_worker():
+    """Drains queued admin notifications in batches; runs as a background task."""
+    while True:
+        await _admin_notify_queue.get()
+        await asyncio.sleep(_ADMIN_NOTIFY_WINDOW)
+        count = 1
+        while True:
+            try:
+                _admin_notify_queue.get_nowait()
+                count += 1
+            except asyncio.QueueEmpty:
+                break
+        text = "🛎️ Новая заявка на модерацию!" if count == 1 else f"🛎️ Новых заявок на модерацию: {count}!"
+        try:
+            await moderator_bot.send_message(ADMIN_ID, text, reply_markup=_ADMIN_PANEL_MARKUP)
+        except Exception as e:
+            logger.error(f"Failed to send notification to admin {ADMIN_ID}: {e}")
+
+# Cooldown deadlines on the monotonic clock. A hit answers the check
+# without a DB query or datetime parsing; SQLite is only consulted on a
+# miss (e.g. after a restart), making repeat /start spam essentially free.
+_cooldowns: dict[int, float] = {}
+
+
+async def _cooldown_remaining(user_id: int) -> float:
+    """Returns the remaining cooldown in seconds, or 0 if none is active."""
+    now = time.monotonic()
+    deadline = _cooldowns.get(user_id)
+    if deadline is not None:
+        if now < deadline:
+            return deadline - now
+        del _cooldowns[user_id]
+        return 0.0
+
+    last_submission_time = await db.get_last_submission_time(user_id)
+    if last_submission_time:
+        elapsed = (datetime.now() - last_submission_time).total_seconds()
+        if elapsed < SUBMISSION_COOLDOWN:
+            remaining = SUBMISSION_COOLDOWN - elapsed
+            _cooldowns[user_id] = now + remaining
+            return remaining
+    return 0.0
+
 
 async def is_on_cooldown(user_id: int) -> bool:
     """Checks if a user is in the submission cooldown period."""
-    last_submission_time = await db.get_last_submission_time(user_id)
-    if last_submission_time and (datetime.now() - last_submission_time).total_seconds() < SUBMISSION_COOLDOWN:
-        remaining = int(SUBMISSION_COOLDOWN - (datetime.now() - last_submission_time).total_seconds())
+    remaining = await _cooldown_remaining(user_id)
+    if remaining > 0:
         await hunter_bot.send_message(
             user_id,
             f"⏳ Вы слишком часто подаете объявления. "
-            f"Пожалуйста, подождите еще примерно {remaining // 60} мин."
+            f"Пожалуйста, подождите еще примерно {int(remaining) // 60} мин."
         )
         return True
     return False
 
 async def notify_admin_of_new_submission():
-    """Sends a notification to the admin about a new submission."""
+    """Queues an admin notification for the next aggregated batch."""
     if not ADMIN_ID:
         return
     try:
-        markup = InlineKeyboardMarkup()
-        markup.add(InlineKeyboardButton("Перейти в админ-панель", url=f"http://{DOMAIN_NAME}/admin"))
-        await moderator_bot.send_message(ADMIN_ID, "🛎️ Новая заявка на модерацию!", reply_markup=markup)
-    except Exception as e:
-        logger.error(f"Failed to send notification to admin {ADMIN_ID}: {e}")
+        _admin_notify_queue.put_nowait(None)
+    except asyncio.QueueFull:
+        # The notifier is far behind; send directly rather than drop.
+        try:
+            await moderator_bot.send_message(ADMIN_ID, "🛎️ Новая заявка на модерацию!", reply_markup=_ADMIN_PANEL_MARKUP)
+        except Exception as e:
+            logger.error(f"Failed to send notification to admin {ADMIN_ID}: {e}")
 
 async def finalize_submission(user_id: int, state: dict, submission_type: str):
     """Saves the submission to the DB, notifies admin, and cleans up state."""
-    submission_id = f"sub_{user_id}_{int(datetime.now().timestamp())}"
+    submission_id = new_submission_id('sub', user_id)
     await db.save_submission_to_db(submission_id, submission_type, state['data'], user_id)
+    _cooldowns[user_id] = time.monotonic() + SUBMISSION_COOLDOWN
+    api_cache.invalidate('stats', 'submissions')
     await notify_admin_of_new_submission()
     await hunter_bot.send_message(user_id, "Спасибо! Ваше объявление отправлено на модерацию. Оно появится в канале сразу после проверки.")
     await db.clear_user_state(user_id)
 
+# --- Callback Handlers ---
+# Callback data values form a small fixed set, so callbacks dispatch
+# through _CB_HANDLERS with an exact-match lookup instead of a chain of
+# startswith filters evaluated per query.
+
+async def _cb_action_offer(call: CallbackQuery):
+    user_id = call.message.chat.id
+    await db.set_user_state(user_id, 'offer_type', {'type': 'rent_offer'})
+    await hunter_bot.edit_message_text(
+        "Отлично! Вы хотите сдать жильё на долгий срок или посуточно?",
+        user_id, call.message.message_id, reply_markup=_OFFER_TYPE_MARKUP
+    )
+
+async def _cb_action_request(call: CallbackQuery):
+    user_id = call.message.chat.id
+    await db.set_user_state(user_id, 'request_description', {'type': 'rent_request'})
+    await hunter_bot.edit_message_text(
+        "Понимаю. Опишите в одном сообщении, какое жильё вы ищете "
+        "(район, кол-во комнат, бюджет и т.д.). Эту заявку увидят собственники.",
+        user_id, call.message.message_id
+    )
+
+async def _cb_offer_type(call: CallbackQuery):
+    user_id = call.message.chat.id
+    rent_type = call.data.replace('type_', '')
+    state = await db.get_user_state(user_id)
+    if not state: return
+
+    state['data']['rent_type'] = rent_type
+    await db.patch_user_state(user_id, 'offer_description', {'rent_type': rent_type})
+    await hunter_bot.edit_message_text(
+        "Теперь, пожалуйста, напишите подробное описание вашего жилья: "
+        "кол-во комнат, адрес, состояние, мебель, техника и т.д. "
+        "Вся информация в одном сообщении.",
+        user_id, call.message.message_id
+    )
+
+async def _cb_add_more_photos(call: CallbackQuery):
+    # One edit replaces the old markup-strip + extra message pair: editing
+    # the prompt text drops the keyboard and delivers the next instruction
+    # in a single Bot API round-trip.
+    await hunter_bot.edit_message_text(
+        "Присылайте следующее фото.",
+        call.message.chat.id, call.message.message_id
+    )
+
+async def _cb_photos_done(call: CallbackQuery):
+    user_id = call.message.chat.id
+    state = await db.get_user_state(user_id)
+    if not state or not state['data'].get('photos'):
+        await hunter_bot.answer_callback_query(call.id, "Пожалуйста, отправьте хотя бы одну фотографию.", show_alert=True)
+        return
+
+    await db.patch_user_state(user_id, 'offer_contact', {})
+    await hunter_bot.edit_message_text("Отлично! Фотографии добавлены.", user_id, call.message.message_id)
+    await hunter_bot.send_message(user_id, "Последний шаг: напишите ваш контактный телефон или юзернейм в Telegram для связи.")
+
+_CB_HANDLERS = {
+    'action_offer': _cb_action_offer,
+    'action_request': _cb_action_request,
+    'type_long_term': _cb_offer_type,
+    'type_daily': _cb_offer_type,
+    'add_more_photos': _cb_add_more_photos,
+    'photos_done': _cb_photos_done,
+}
+
+
 def register_hunter_handlers():
     """Registers all handlers for the Hunter bot."""
 
@@ -56,72 +208,12 @@ def register_hunter_handlers():
         await db.clear_user_state(user_id)
         await db.set_user_state(user_id, 'start', {})
 
-        markup = InlineKeyboardMarkup(row_width=1)
-        markup.add(InlineKeyboardButton('🏠 Сдать жильё', callback_data='action_offer'))
-        markup.add(InlineKeyboardButton('🔍 Ищу жильё', callback_data='action_request'))
-        await hunter_bot.send_message(
-            user_id,
-            "Здравствуйте! Я помогу вам сдать или найти жильё в Мелитополе.\n\n"
-            "Что вы хотите сделать?",
-            reply_markup=markup
-        )
-
-    @hunter_bot.callback_query_handler(func=lambda call: call.data.startswith('action_'))
-    async def handle_action_choice(call: CallbackQuery):
-        user_id = call.message.chat.id
-        action = call.data.split('_')[1]
-
-        if action == 'offer':
-            await db.set_user_state(user_id, 'offer_type', {'type': 'rent_offer'})
-            markup = InlineKeyboardMarkup(row_width=2)
-            markup.add(
-                InlineKeyboardButton('🗓 На долгий срок', callback_data='type_long_term'),
-                InlineKeyboardButton('☀️ Посуточно', callback_data='type_daily')
-            )
-            await hunter_bot.edit_message_text(
-                "Отлично! Вы хотите сдать жильё на долгий срок или посуточно?",
-                user_id, call.message.message_id, reply_markup=markup
-            )
-        elif action == 'request':
-            await db.set_user_state(user_id, 'request_description', {'type': 'rent_request'})
-            await hunter_bot.edit_message_text(
-                "Понимаю. Опишите в одном сообщении, какое жильё вы ищете "
-                "(район, кол-во комнат, бюджет и т.д.). Эту заявку увидят собственники.",
-                user_id, call.message.message_id
-            )
-
-    @hunter_bot.callback_query_handler(func=lambda call: call.data.startswith('type_'))
-    async def handle_offer_type(call: CallbackQuery):
-        user_id = call.message.chat.id
-        rent_type = call.data.replace('type_', '')
-        state = await db.get_user_state(user_id)
-        if not state: return
-
-        state['data']['rent_type'] = rent_type
-        await db.set_user_state(user_id, 'offer_description', state['data'])
-        await hunter_bot.edit_message_text(
-            "Теперь, пожалуйста, напишите подробное описание вашего жилья: "
-            "кол-во комнат, адрес, состояние, мебель, техника и т.д. "
-            "Вся информация в одном сообщении.",
-            user_id, call.message.message_id
-        )
-
-    @hunter_bot.callback_query_handler(func=lambda call: call.data == 'add_more_photos')
-    async def handle_add_more_photos(call: CallbackQuery):
-        await hunter_bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id)
-        await hunter_bot.send_message(call.message.chat.id, "Присылайте следующее фото.")
-
-    @hunter_bot.callback_query_handler(func=lambda call: call.data == 'photos_done')
-    async def handle_offer_photos_done(call: CallbackQuery):
-        user_id = call.message.chat.id
-        state = await db.get_user_state(user_id)
-        if not state or not state['data'].get('photos'):
-            await hunter_bot.answer_callback_query(call.id, "Пожалуйста, отправьте хотя бы одну фотографию.", show_alert=True)
-            return
+        await hunter_bot.send_message(user_id, _START_TEXT, reply_markup=_START_MARKUP)
 
-        await db.set_user_state(user_id, 'offer_contact', state['data'])
-        await hunter_bot.edit_message_text("Отлично! Фотографии добавлены.", user_id, call.message.message_id)
-        await hunter_bot.send_message(user_id, "Последний шаг: напишите ваш контактный телефон или юзернейм в Telegram для связи.")
+    @hunter_bot.callback_query_handler(func=lambda call: call.data in _CB_HANDLERS)
+    async def handle_callbacks(call: CallbackQuery):
+        """Routes callbacks via one exact-match dict lookup."""
+        await _CB_HANDLERS[call.data](call)
 
     # --- State-based Message Handlers ---
 
@@ -137,55 +229,77 @@ def register_hunter_handlers():
             await hunter_bot.send_message(user_id, "Чтобы начать, пожалуйста, используйте команду /start.")
             return
 
-        current_step = state.get('step')
-
-        # --- Offer Workflow ---
-        if current_step == 'offer_description':
-            state['data']['description'] = message.text
-            rent_type = state['data'].get('rent_type')
-            price_question = "Укажите цену в рублях за месяц." if rent_type == 'long_term' else "Укажите цену в рублях за сутки."
-            await db.set_user_state(user_id, 'offer_price', state['data'])
-            await hunter_bot.send_message(user_id, f"Отлично. {price_question} Просто напишите число.")
-
-        elif current_step == 'offer_price':
-            if message.text and message.text.isdigit():
-                state['data']['price'] = int(message.text)
-                state['data']['photos'] = []
-                await db.set_user_state(user_id, 'offer_photos', state['data'])
-                await hunter_bot.send_message(user_id, "Понял. Теперь отправьте, пожалуйста, ваше лучшее фото. Позже можно будет добавить еще.")
-            else:
-                await hunter_bot.send_message(user_id, "Пожалуйста, введите цену цифрами, без других символов.")
-
-        elif current_step == 'offer_photos':
-            if message.content_type == 'photo':
-                state['data']['photos'].append(message.photo[-1].file_id)
-                await db.set_user_state(user_id, 'offer_photos', state['data'])
-
-                markup = InlineKeyboardMarkup(row_width=2)
-                finish_button = InlineKeyboardButton("✅ Завершить", callback_data="photos_done")
-
-                if len(state['data']['photos']) < 5:
-                    add_more_button = InlineKeyboardButton("➕ Добавить еще", callback_data="add_more_photos")
-                    markup.add(add_more_button, finish_button)
-                    await hunter_bot.send_message(user_id, f"Фото {len(state['data']['photos'])}/5 добавлено. Хотите добавить еще или завершить?", reply_markup=markup)
-                else:
-                    markup.add(finish_button)
-                    await hunter_bot.send_message(user_id, "Лимит в 5 фото достигнут. Нажмите 'Завершить', чтобы продолжить.", reply_markup=markup)
-            else:
-                await hunter_bot.send_message(user_id, "Пожалуйста, отправьте фото.")
-
-        elif current_step == 'offer_contact':
-            state['data']['contact'] = message.text
-            state['data']['author_username'] = message.from_user.username
-            state['data']['author_id'] = user_id
-            submission_type = f"rent_offer_{state['data']['rent_type']}"
-            await finalize_submission(user_id, state, submission_type)
-
-        # --- Request Workflow ---
-        elif current_step == 'request_description':
-            state['data']['description'] = message.text
-            state['data']['author_username'] = message.from_user.username
-            state['data']['author_id'] = user_id
-            await finalize_submission(user_id, state, 'rent_request')
-
-    logger.info("Handlers for the Hunter Bot have been registered.")
\ No newline at end of file
+        step_handler = _STEP_HANDLERS.get(state.get('step'))
+        if step_handler:
+            await step_handler(message, state)
+
+    logger.info("Handlers for the Hunter Bot have been registered.")
+
+
+# --- Step Handlers ---
+# One function per conversation step; handle_stateful_messages dispatches
+# through _STEP_HANDLERS with a single dict lookup instead of walking an
+# if/elif chain for every incoming message.
+
+async def _step_offer_description(message: Message, state: dict):
+    user_id = message.chat.id
+    state['data']['description'] = message.text
+    rent_type = state['data'].get('rent_type')
+    price_question = "Укажите цену в рублях за месяц." if rent_type == 'long_term' else "Укажите цену в рублях за сутки."
+    await db.patch_user_state(user_id, 'offer_price', {'description': message.text})
+    await hunter_bot.send_message(user_id, f"Отлично. {price_question} Просто напишите число.")
+
+async def _step_offer_price(message: Message, state: dict):
+    user_id = message.chat.id
+    # Single int() pass instead of isdigit() + int(), which scanned
+    # the string twice; also rejects zero and absurd values.
+    try:
+        price = int((message.text or '').strip())
+    except ValueError:
+        price = 0
+    if 0 < price < 10_000_000:
+        state['data']['price'] = price
+        state['data']['photos'] = []
+        await db.patch_user_state(user_id, 'offer_photos', {'price': price, 'photos': []})
+        await hunter_bot.send_message(user_id, "Понял. Теперь отправьте, пожалуйста, ваше лучшее фото. Позже можно будет добавить еще.")
+    else:
+        await hunter_bot.send_message(user_id, "Пожалуйста, введите цену цифрами, без других символов.")
+
+async def _step_offer_photos(message: Message, state: dict):
+    user_id = message.chat.id
+    if message.content_type != 'photo':
+        await hunter_bot.send_message(user_id, "Пожалуйста, отправьте фото.")
+        return
+
+    file_id = message.photo[-1].file_id
+    state['data']['photos'].append(file_id)
+    # Appended in SQLite via json_set; the full photo list is not rewritten.
+    await db.append_user_photo(user_id, file_id)
+
+    if len(state['data']['photos']) < 5:
+        await hunter_bot.send_message(user_id, f"Фото {len(state['data']['photos'])}/5 добавлено. Хотите добавить еще или завершить?", reply_markup=_PHOTOS_CONTINUE_MARKUP)
+    else:
+        await hunter_bot.send_message(user_id, "Лимит в 5 фото достигнут. Нажмите 'Завершить', чтобы продолжить.", reply_markup=_PHOTOS_DONE_MARKUP)
+
+async def _step_offer_contact(message: Message, state: dict):
+    user_id = message.chat.id
+    state['data']['contact'] = message.text
+    state['data']['author_username'] = message.from_user.username
+    state['data']['author_id'] = user_id
+    submission_type = f"rent_offer_{state['data']['rent_type']}"
+    await finalize_submission(user_id, state, submission_type)
+
+async def _step_request_description(message: Message, state: dict):
+    user_id = message.chat.id
+    state['data']['description'] = message.text
+    state['data']['author_username'] = message.from_user.username
+    state['data']['author_id'] = user_id
+    await finalize_submission(user_id, state, 'rent_request')
+
+_STEP_HANDLERS = {
+    'offer_description': _step_offer_description,
+    'offer_price': _step_offer_price,
+    'offer_photos': _step_offer_photos,
+    'offer_contact': _step_offer_contact,
+    'request_description': _step_request_description,
+}
\ No newline at end of file
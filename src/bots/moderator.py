@@ -6,18 +6,143 @@ such as viewing statistics and handling the final publication of approved
 submissions.
 """
 import asyncio
-import json
 from html import escape
 from typing import Dict, Any, Optional
-from datetime import datetime
 
-import aiosqlite
 import telebot.types
 from telebot.types import Message
 
-from .utils import moderator_bot, sync_moderator_bot, hunter_bot
+from .utils import moderator_bot, hunter_bot, download_telegram_file, new_submission_id, cached_get_file
 from src import database as db
-from src.config import ADMIN_ID, CHANNEL_ID, DB_PATH, logger
+from src.config import ADMIN_ID, CHANNEL_ID, HUNTER_BOT_TOKEN, logger
+from src.web import cache as api_cache
+
+# Bounds how many publication flows may run at once so a burst of
+# approvals cannot exhaust the bots' HTTP connection pools or buffer an
+# unbounded amount of photo bytes in memory.
+_publish_sem = asyncio.Semaphore(4)
+
+# The caption layout is fixed; only the field values change per listing,
+# so the template is built once at import time.
+CAPTION_TPL = (
+    "<b>🏠 {rent_type_text}</b>\n\n"
+    "{description}\n\n"
+    "📍 <b>Адрес:</b> {address}\n"
+    "💰 <b>Цена:</b> {price} {price_suffix}\n"
+    "📞 <b>Контакт:</b> {contact}"
+)
+
+# Display label and price unit per rent type; lookup with a default
+# instead of repeated ternaries keyed on 'long_term'.
+_RENT_LABELS = {
+    'long_term': ("На долгий срок", "₽/мес."),
+    'daily': ("Посуточно", "₽/сутки"),
+}
+
+
+async def _photo_file_url(file_id: str) -> str:
+    """Resolves a file_id to its short-lived Bot API file URL."""
+    file_path = await cached_get_file(hunter_bot, file_id)
+    return f"https://api.telegram.org/file/bot{HUNTER_BOT_TOKEN}/{file_path}"
+
+
+async def _download_photo(file_id: str) -> bytes:
+    """Downloads a single photo's bytes from Telegram via the hunter bot."""
+    file_path = await cached_get_file(hunter_bot, file_id)
+    # Fetch over the shared keep-alive session instead of download_file,
+    # which opens a fresh HTTPS connection per call.
+    return await download_telegram_file(HUNTER_BOT_TOKEN, file_path)
+
+
+def _build_media(items: list, caption: str) -> list:
+    """Wraps photo sources (file_ids, URLs or bytes) into InputMediaPhoto items."""
+    return [
+        telebot.types.InputMediaPhoto(
+            media=item,
+            caption=caption if i == 0 else None,
+            parse_mode='HTML'
+        )
+        for i, item in enumerate(items)
+    ]
+
+
+async def _send_by_file_id(caption: str, photos_ids: list) -> Optional[Message]:
+    """Re-sends the hunter bot's file_ids to the channel; no byte transfer."""
+    if len(photos_ids) == 1:
+        return await hunter_bot.send_photo(CHANNEL_ID, photos_ids[0], caption=caption)
+    msgs = await hunter_bot.send_media_group(CHANNEL_ID, _build_media(photos_ids, caption))
+    return msgs[0] if msgs else None
+
+
+async def _send_by_file_url(caption: str, photos_ids: list) -> Optional[Message]:
+    """Sends Bot API file URLs; Telegram fetches the bytes server-side."""
+    urls = await asyncio.gather(*(_photo_file_url(fid) for fid in photos_ids))
+    if len(urls) == 1:
+        return await moderator_bot.send_photo(CHANNEL_ID, urls[0], caption=caption)
+    msgs = await moderator_bot.send_media_group(CHANNEL_ID, _build_media(list(urls), caption))
+    return msgs[0] if msgs else None
+
+
+async def _send_by_bytes(caption: str, photos_ids: list) -> Optional[Message]:
+    """
+    Last resort: upload the photos through the moderator bot.
+
+    Moderator-side file_ids captured on earlier uploads are re-sent as
+    plain strings (no byte transfer); only uncached photos are downloaded
+    and re-uploaded, and their new file_ids are persisted for next time.
+    """
+    cached = await db.get_cached_file_ids(photos_ids)
+    sources: list = [cached.get(fid) for fid in photos_ids]
+
+    # Downloads are independent network I/O; run them concurrently
+    # instead of paying one round-trip after another.
+    misses = [fid for fid, src in zip(photos_ids, sources) if src is None]
+    contents = iter(await asyncio.gather(*(_download_photo(fid) for fid in misses)))
+    sources = [src if src is not None else next(contents) for src in sources]
+
+    if len(sources) == 1:
+        msgs = [await moderator_bot.send_photo(CHANNEL_ID, sources[0], caption=caption)]
+    else:
+        msgs = await moderator_bot.send_media_group(CHANNEL_ID, _build_media(sources, caption))
+    if not msgs:
+        return None
+
+    try:
+        await db.cache_file_ids([
+            (fid, msg.photo[-1].file_id)
+            for fid, src, msg in zip(photos_ids, sources, msgs)
+            if not isinstance(src, str) and msg.photo
+        ])
+    except Exception as e:
+        logger.warning(f"Could not cache moderator-side file_ids: {e}")
+
+    return msgs[0]
+
+
+async def _send_photos(caption: str, photos_ids: list) -> Optional[Message]:
+    """
+    Sends the listing photos to the channel, cheapest transport first.
+
+    The file_ids belong to the hunter bot, which can re-send them to the
+    channel without transferring any image bytes. If that fails (e.g. the
+    hunter bot cannot post to the channel), the moderator bot sends the
+    short-lived Bot API file URLs so Telegram pulls the bytes server-side
+    — still no local download or re-upload. Only if that also fails are
+    the photos downloaded and re-uploaded as raw bytes.
+    """
+    try:
+        logger.debug("Publishing %d photo(s) by file_id pass-through.", len(photos_ids))
+        return await _send_by_file_id(caption, photos_ids)
+    except Exception as e:
+        logger.warning(f"file_id pass-through failed ({e}), trying file-URL publication.")
+
+    try:
+        return await _send_by_file_url(caption, photos_ids)
+    except Exception as e:
+        logger.warning(f"File-URL publication failed ({e}), falling back to download and re-upload.")
+
+    return await _send_by_bytes(caption, photos_ids)
+
 
 async def publish_listing(user_id: int, submission: Dict[str, Any]) -> None:
     """
@@ -31,67 +156,39 @@ async def publish_listing(user_id: int, submission: Dict[str, Any]) -> None:
         user_id: The ID of the user who submitted the listing.
         submission: The submission dictionary containing all data.
     """
-    logger.info(f"Starting publication process for user {user_id}.")
+    logger.debug("Starting publication process for user %d.", user_id)
 
     submission_data = submission['data']
-    submission_id = f"list_{user_id}_{int(datetime.now().timestamp())}"
+    submission_id = new_submission_id('list', user_id)
     submission_data['id'] = submission_id
 
     rent_type = submission_data.get('rent_type', 'N/A')
-    rent_type_text = "На долгий срок" if rent_type == 'long_term' else "Посуточно"
-    price_suffix = "₽/мес." if rent_type == 'long_term' else "₽/сутки"
+    rent_type_text, price_suffix = _RENT_LABELS.get(rent_type, _RENT_LABELS['daily'])
 
     # Sanitize all user-provided data before including it in the HTML caption
-    safe_description = escape(submission_data.get('description', ''))
-    safe_address = escape(submission_data.get('address', ''))
-    safe_contact = escape(submission_data.get('contact', ''))
-    price = escape(str(submission_data.get('price', '')))
-
-    caption = (
-        f"<b>🏠 {rent_type_text}</b>\n\n"
-        f"{safe_description}\n\n"
-        f"📍 <b>Адрес:</b> {safe_address}\n"
-        f"💰 <b>Цена:</b> {price} {price_suffix}\n"
-        f"📞 <b>Контакт:</b> {safe_contact}"
-    )
+    caption = CAPTION_TPL.format_map({
+        'rent_type_text': rent_type_text,
+        'price_suffix': price_suffix,
+        'description': escape(submission_data.get('description', '')),
+        'address': escape(submission_data.get('address', '')),
+        'contact': escape(submission_data.get('contact', '')),
+        'price': escape(str(submission_data.get('price', ''))),
+    })
 
     photos_ids: list[str] = submission_data.get('photos', [])
     msg: Optional[Message] = None
 
     try:
         if not photos_ids:
-            logger.info("No photos found. Publishing text-only message.")
+            logger.debug("No photos found. Publishing text-only message.")
             msg = await moderator_bot.send_message(CHANNEL_ID, caption)
-        elif len(photos_ids) == 1:
-            file_id = photos_ids[0]
-            logger.info(f"Processing one photo (file_id: {file_id})")
-            file_info = await hunter_bot.get_file(file_id)
-            file_content = await hunter_bot.download_file(file_info.file_path)
-            msg = await moderator_bot.send_photo(CHANNEL_ID, file_content, caption=caption)
         else:
-            logger.info(f"Processing a media group of {len(photos_ids)} photos.")
-            media: list[telebot.types.InputMediaPhoto] = []
-            for i, file_id in enumerate(photos_ids):
-                logger.info(f"Downloading photo {i+1}/{len(photos_ids)}: {file_id}")
-                file_info = await hunter_bot.get_file(file_id)
-                file_content = await hunter_bot.download_file(file_info.file_path)
-                media.append(
-                    telebot.types.InputMediaPhoto(
-                        media=file_content,
-                        caption=caption if i == 0 else '',
-                        parse_mode='HTML'
-                    )
-                )
-
-            if media:
-                logger.info("Sending media group to the channel...")
-                # Use to_thread for the synchronous send_media_group call
-                msgs = await asyncio.to_thread(sync_moderator_bot.send_media_group, CHANNEL_ID, media)
-                msg = msgs[0] if msgs else None
+            msg = await _send_photos(caption, photos_ids)
 
         if msg:
-            logger.info(f"Publication successful (message_id: {msg.message_id}). Saving to database.")
+            logger.info("Publication successful (message_id: %s). Saving to database.", msg.message_id)
             await db.add_listing(submission_id, submission.get('type'), submission_data, msg.message_id)
+            api_cache.invalidate('stats', 'listings')
             await moderator_bot.send_message(user_id, "Отлично, адрес получен! Ваше объявление опубликовано в канале.")
         else:
             raise Exception("Failed to send message to channel (message object was not received).")
@@ -128,16 +225,27 @@ def register_moderator_handlers():
     async def handle_address_and_publish(message: Message):
         user_id = message.chat.id
 
-        # This handler should only be triggered for users in the 'pending_publication' state
-        submission = await db.get_pending_publication(user_id)
-
-        if not submission:
-            # Optionally, send a message to users who send random text to this bot
-            if str(user_id) == str(ADMIN_ID):
-                 await moderator_bot.send_message(user_id, "Я готов к работе. Ожидаю адрес для публикации объявления.")
+        # Apply backpressure before consuming the pending row, so a
+        # submission is never lost to a timeout after being dequeued.
+        try:
+            await asyncio.wait_for(_publish_sem.acquire(), timeout=30)
+        except asyncio.TimeoutError:
+            await moderator_bot.send_message(user_id, "Сервис сейчас перегружен. Пожалуйста, отправьте адрес ещё раз через минуту.")
             return
 
-        submission['data']['address'] = message.text
-        await publish_listing(user_id, submission)
+        try:
+            # This handler should only be triggered for users in the 'pending_publication' state
+            submission = await db.get_pending_publication(user_id)
+
+            if not submission:
+                # Optionally, send a message to users who send random text to this bot
+                if str(user_id) == str(ADMIN_ID):
+                     await moderator_bot.send_message(user_id, "Я готов к работе. Ожидаю адрес для публикации объявления.")
+                return
+
+            submission['data']['address'] = message.text
+            await publish_listing(user_id, submission)
+        finally:
+            _publish_sem.release()
 
     logger.info("Handlers for the Moderator Bot have been registered.")
\ No newline at end of file
@@ -4,7 +4,11 @@ Bot Utilities Module.
 This module initializes and provides centralized access to the Telegram bot instances.
 This helps prevent circular dependencies between the bot handler modules.
 """
-import telebot
+import itertools
+import time
+from typing import Optional
+
+import aiohttp
 from telebot.async_telebot import AsyncTeleBot
 
 from src.config import MODERATOR_BOT_TOKEN, HUNTER_BOT_TOKEN
@@ -20,7 +24,93 @@ assert HUNTER_BOT_TOKEN is not None, "HUNTER_BOT_TOKEN is not set in environment
 moderator_bot: AsyncTeleBot = AsyncTeleBot(MODERATOR_BOT_TOKEN, parse_mode='HTML')
 hunter_bot: AsyncTeleBot = AsyncTeleBot(HUNTER_BOT_TOKEN, parse_mode='HTML')
 
-# Synchronous instance for operations not fully supported in async mode,
-# such as sending media groups with in-memory file content.
-# This should only be used with `asyncio.to_thread`.
-sync_moderator_bot: telebot.TeleBot = telebot.TeleBot(MODERATOR_BOT_TOKEN, parse_mode='HTML')
\ No newline at end of file
+# --- Submission ID Generation ---
+
+# IDs were previously built from int(datetime.now().timestamp()), which
+# collides when the same user produces two IDs within one second. A
+# nanosecond clock plus a process-local counter keeps them unique without
+# any I/O.
+_id_counter = itertools.count()
+
+
+def new_submission_id(prefix: str, user_id: int) -> str:
+    """Builds a unique submission/listing ID like 'sub_<uid>_<ns>_<n>'."""
+    return f"{prefix}_{user_id}_{time.time_ns()}_{next(_id_counter)}"
+
+
+# --- get_file Memoization ---
+
+# Bot API file_paths stay valid for about an hour; memoizing
+# file_id -> file_path spares a get_file round-trip when the same photo
+# is resolved again (e.g. the URL tier fails and the byte tier retries).
+_FILE_PATH_TTL = 50 * 60
+_file_path_cache: dict[str, tuple[float, str]] = {}
+
+
+async def cached_get_file(bot: AsyncTeleBot, file_id: str) -> str:
+    """Returns the Bot API file_path for a file_id, memoized for ~50 minutes."""
+    now = time.monotonic()
+    entry = _file_path_cache.get(file_id)
+    if entry is not None and now < entry[0]:
+        return entry[1]
+    file_info = await bot.get_file(file_id)
+    _file_path_cache[file_id] = (now + _FILE_PATH_TTL, file_info.file_path)
+    return file_info.file_path
+
+
+# --- Shared HTTP Session for File Downloads ---
+
+# pyTelegramBotAPI opens a fresh HTTPS connection per file download; a
+# shared keep-alive session avoids paying a TLS handshake per photo.
+_tg_session: Optional[aiohttp.ClientSession] = None
+
+
+async def init_tg_session() -> None:
+    """Opens the shared HTTP session used for Bot API file downloads."""
+    global _tg_session
+    if _tg_session is None:
+        _tg_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=75)
+        )
+
+
+async def close_tg_session() -> None:
+    """Closes the shared HTTP session, if it was opened."""
+    global _tg_session
+    if _tg_session is not None:
+        await _tg_session.close()
+        _tg_session = None
+
+
+async def download_telegram_file(token: str, file_path: str) -> bytes:
+    """
+    Downloads a file from the Bot API file endpoint over the shared session.
+
+    Args:
+        token: The token of the bot that owns the file.
+        file_path: The path returned by `get_file` for the file_id.
+
+    Returns:
+        The raw file bytes.
+    """
+    assert _tg_session is not None, "Telegram HTTP session is not initialized."
+    url = f"https://api.telegram.org/file/bot{token}/{file_path}"
+    async with _tg_session.get(url) as resp:
+        resp.raise_for_status()
+        return await resp.read()
+
+
+async def stream_telegram_file(token: str, file_path: str, chunk_size: int = 65536):
+    """
+    Yields a file from the Bot API file endpoint in chunks.
+
+    Unlike `download_telegram_file`, this never holds more than one chunk
+    in memory, so large photos can be relayed to a client without
+    buffering the whole body first.
+    """
+    assert _tg_session is not None, "Telegram HTTP session is not initialized."
+    url = f"https://api.telegram.org/file/bot{token}/{file_path}"
+    async with _tg_session.get(url) as resp:
+        resp.raise_for_status()
+        async for chunk in resp.content.iter_chunked(chunk_size):
+            yield chunk
\ No newline at end of file
@@ -13,7 +13,9 @@ from typing import Optional
 # In a container, environment variables are injected directly.
 try:
     from dotenv import load_dotenv
-    load_dotenv()
+    # override=False: values already present in os.environ win, so a
+    # container environment is never shadowed by a stray .env file.
+    load_dotenv(override=False)
 except ImportError:
     # This is expected in a production container where python-dotenv is not installed.
     # The application will rely on environment variables provided by Docker/the system.
@@ -29,7 +31,11 @@ ADMIN_ID: Optional[str] = os.getenv('ADMIN_ID')
 
 # --- Web & Database Settings ---
 DOMAIN_NAME: str = os.getenv('DOMAIN_NAME', 'localhost')
+# Optional bearer token protecting the moderation API (approve/reject).
+# When unset, the endpoints stay open as before; a warning is logged.
+ADMIN_API_TOKEN: Optional[str] = os.getenv('ADMIN_API_TOKEN')
 DB_PATH: str = '/app/app_data/listings.db'
+IMAGE_CACHE_DIR: str = '/app/app_data/image_cache'
 SUBMISSION_COOLDOWN: int = 900  # Cooldown period in seconds (15 minutes)
 
 # --- Logging Initialization ---
@@ -40,6 +46,13 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # --- Critical Configuration Validation ---
+
+# Validation runs at import time and is also called from main.py; the
+# sentinel makes repeat calls no-ops instead of re-checking and
+# re-logging.
+_VALIDATED = False
+
+
 def validate_config() -> None:
     """
     Validates that all essential environment variables are set.
@@ -47,6 +60,9 @@ def validate_config() -> None:
     Raises:
         SystemExit: If any critical environment variables are missing.
     """
+    global _VALIDATED
+    if _VALIDATED:
+        return
     critical_vars = {
         'MODERATOR_BOT_TOKEN': MODERATOR_BOT_TOKEN,
         'HUNTER_BOT_TOKEN': HUNTER_BOT_TOKEN,
@@ -62,6 +78,7 @@ def validate_config() -> None:
         )
         exit(1)
 
+    _VALIDATED = True
     logger.info("Configuration successfully loaded and validated.")
 
 # Perform validation when the module is imported.
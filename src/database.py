@@ -5,18 +5,131 @@ This module handles all interactions with the SQLite database, including:
 - Initializing the database and tables.
 - Managing user session states for the conversation flow.
 - Handling submissions, pending publications, and final listings.
+
+Writes share a single long-lived aiosqlite connection. Opening a fresh
+connection per call spawns a new worker thread and re-reads the schema
+every time, which blocks the event loop on every request; the shared
+connection amortizes that cost across the process lifetime. Read-only
+queries go through a small pool of query_only connections so WAL-mode
+readers can proceed in parallel with the writer.
 """
 import aiosqlite
-import json
+import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 
 from .config import DB_PATH, logger
+from .serialization import dumps_str, loads
+
+# --- Shared Connection Management ---
+
+_db: Optional[aiosqlite.Connection] = None
+_db_init_lock = asyncio.Lock()
+
+# Serializes multi-statement write transactions. Because all writers share
+# one connection, an unrelated commit issued mid-transaction would commit
+# someone else's partial work. Composable helpers that accept an explicit
+# connection argument never commit; callers hold this lock and commit once.
+write_lock = asyncio.Lock()
+
+
+async def _configure_connection(db: aiosqlite.Connection) -> None:
+    """
+    Applies performance PRAGMAs to a freshly opened connection.
+
+    WAL mode lets readers proceed concurrently with the writer, and
+    synchronous=NORMAL drops the per-commit fsync (safe in WAL mode).
+    The remaining PRAGMAs size the page cache, keep temporary structures
+    in memory, and make writers wait instead of failing with SQLITE_BUSY.
+    """
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute("PRAGMA temp_store=MEMORY")
+    await db.execute("PRAGMA cache_size=-64000")
+    await db.execute("PRAGMA mmap_size=268435456")
+    await db.execute("PRAGMA foreign_keys=ON")
+    await db.execute("PRAGMA busy_timeout=5000")
+
+
+async def get_db() -> aiosqlite.Connection:
+    """
+    Returns the shared application-wide database connection.
+
+    The connection is created lazily on first use and reused for the
+    lifetime of the process. Use `close_db()` during shutdown.
+    """
+    global _db
+    if _db is None:
+        async with _db_init_lock:
+            if _db is None:
+                conn = await aiosqlite.connect(DB_PATH)
+                await _configure_connection(conn)
+                _db = conn
+    return _db
+
+
+# --- Reader Pool ---
+
+# WAL mode allows readers to proceed in parallel with the single writer,
+# but only across separate connections. The shared connection above is
+# the writer; SELECT-only helpers check a connection out of this small
+# pool so reads are not serialized behind in-flight writes.
+_READER_COUNT = 4
+_reader_queue: Optional[asyncio.Queue] = None
+
+
+async def _get_reader_queue() -> asyncio.Queue:
+    global _reader_queue
+    if _reader_queue is None:
+        async with _db_init_lock:
+            if _reader_queue is None:
+                queue: asyncio.Queue = asyncio.Queue()
+                for _ in range(_READER_COUNT):
+                    conn = await aiosqlite.connect(DB_PATH)
+                    await _configure_connection(conn)
+                    await conn.execute("PRAGMA query_only=ON")
+                    queue.put_nowait(conn)
+                _reader_queue = queue
+    return _reader_queue
+
+
+@asynccontextmanager
+async def acquire_reader():
+    """
+    Checks a read-only connection out of the pool for the duration of
+    one query. Waits if all readers are busy; returns the connection to
+    the pool on exit.
+    """
+    queue = await _get_reader_queue()
+    conn = await queue.get()
+    try:
+        yield conn
+    finally:
+        queue.put_nowait(conn)
 
-# --- Database Initialization ---
 
-import os
+async def close_db() -> None:
+    """Flushes buffered writes and closes all pooled connections."""
+    global _db, _flush_task, _reader_queue
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    if _reader_queue is not None:
+        while not _reader_queue.empty():
+            await _reader_queue.get_nowait().close()
+        _reader_queue = None
+    if _db is not None:
+        try:
+            await flush_pending_states()
+        except Exception as e:
+            logger.error(f"Failed to flush state writes during shutdown: {e}")
+        await _db.close()
+        _db = None
+
+# --- Database Initialization ---
 
 
 async def init_db() -> None:
@@ -26,63 +139,172 @@ async def init_db() -> None:
     Creates all required tables if they do not already exist.
     It assumes the parent directory for the DB file already exists.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS user_sessions (
-                user_id INTEGER PRIMARY KEY,
-                step TEXT NOT NULL,
-                data TEXT NOT NULL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS submissions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                submission_id TEXT UNIQUE NOT NULL,
-                submission_type TEXT NOT NULL,
-                data TEXT NOT NULL,
-                user_id INTEGER,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS pending_publication (
-                user_id INTEGER PRIMARY KEY,
-                submission_type TEXT NOT NULL,
-                data TEXT NOT NULL
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS listings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                submission_id TEXT UNIQUE NOT NULL,
-                listing_type TEXT NOT NULL,
-                data TEXT NOT NULL,
-                message_id INTEGER,
-                published_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        await db.commit()
-        logger.info("Database 'Женева' successfully initialized.")
+    db = await get_db()
+    # One executescript call: a single parse pass and a single commit
+    # instead of a statement round-trip per table/index.
+    await db.executescript('''
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            user_id INTEGER PRIMARY KEY,
+            step TEXT NOT NULL,
+            data TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submission_id TEXT UNIQUE NOT NULL,
+            submission_type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            user_id INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS pending_publication (
+            user_id INTEGER PRIMARY KEY,
+            submission_type TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS listings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submission_id TEXT UNIQUE NOT NULL,
+            listing_type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            message_id INTEGER,
+            published_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS file_id_cache (
+            source_file_id TEXT PRIMARY KEY,
+            cached_file_id TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_listings_published_at ON listings(published_at);
+        CREATE INDEX IF NOT EXISTS idx_sub_user_created ON submissions(user_id, created_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_submissions_created ON submissions(created_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_listings_type ON listings(listing_type);
+    ''')
+    logger.info("Database 'Женева' successfully initialized.")
+
+# --- SQL Statements ---
+
+# Hoisted to module scope so every call passes the identical string
+# object; SQLite's prepared-statement cache is keyed on the SQL text and
+# skips the parse/plan step when it matches.
+_SQL_FLUSH_STATE = "INSERT OR REPLACE INTO user_sessions (user_id, step, data, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)"
+_SQL_GET_STATE = "SELECT step, data FROM user_sessions WHERE user_id = ?"
+_SQL_PATCH_STATE = "UPDATE user_sessions SET step = ?, data = json_patch(data, ?), updated_at = CURRENT_TIMESTAMP WHERE user_id = ?"
+_SQL_APPEND_PHOTO = "UPDATE user_sessions SET data = json_set(data, '$.photos[#]', ?), updated_at = CURRENT_TIMESTAMP WHERE user_id = ?"
+_SQL_CLEAR_STATE = "DELETE FROM user_sessions WHERE user_id = ?"
+_SQL_ADD_SUBMISSION = "INSERT INTO submissions (submission_id, submission_type, data, user_id, created_at) VALUES (?, ?, ?, ?, ?)"
+_SQL_LAST_SUBMISSION = "SELECT created_at FROM submissions WHERE user_id = ? ORDER BY created_at DESC LIMIT 1"
+_SQL_ADD_LISTING = "INSERT INTO listings (submission_id, listing_type, data, message_id) VALUES (?, ?, ?, ?)"
+_SQL_ALL_SUBMISSIONS = "SELECT submission_id, submission_type, data FROM submissions ORDER BY created_at DESC"
+# Range comparison instead of LIKE 'rent_offer_%' so the planner can
+# use idx_listings_type ('`' is the character right after '_').
+_SQL_RENT_OFFER_LISTINGS = "SELECT submission_id, listing_type, data FROM listings WHERE listing_type >= 'rent_offer_' AND listing_type < 'rent_offer`'"
+# published_at is stored as 'YYYY-MM-DD HH:MM:SS' (CURRENT_TIMESTAMP), so a
+# plain string comparison against date('now') selects today's rows while
+# letting the planner range-scan idx_listings_published_at; wrapping the
+# column in date() would force a full scan.
+_SQL_DB_STATS = '''
+    SELECT (SELECT COUNT(*) FROM submissions),
+           (SELECT COUNT(*) FROM listings),
+           (SELECT COUNT(*) FROM listings WHERE published_at >= date('now'))
+'''
+_SQL_GET_SUBMISSION = "SELECT submission_type, data FROM submissions WHERE submission_id=?"
+_SQL_FILE_ID_PUBLIC = "SELECT 1 FROM listings WHERE data LIKE ?"
+_SQL_DELETE_SUBMISSION = "DELETE FROM submissions WHERE submission_id=?"
+_SQL_MOVE_TO_PENDING = "INSERT OR REPLACE INTO pending_publication (user_id, submission_type, data) VALUES (?, ?, ?)"
+_SQL_CONSUME_PENDING = "DELETE FROM pending_publication WHERE user_id=? RETURNING submission_type, data"
+_SQL_CACHE_FILE_IDS = "INSERT OR REPLACE INTO file_id_cache (source_file_id, cached_file_id) VALUES (?, ?)"
 
 # --- User State Management ---
 
+# Write-through cache of conversation states. SQLite stays authoritative
+# (states survive restarts), but repeat reads within a session are served
+# from memory instead of re-querying and re-parsing JSON per message.
+# Entries expire after a TTL and the cache is size-bounded so abandoned
+# conversations cannot grow it without limit; dict insertion order doubles
+# as the eviction order, with hits re-inserted to approximate LRU.
+_STATE_CACHE_TTL = 300.0
+_STATE_CACHE_MAX = 10_000
+_state_cache: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+
+
+def _state_cache_put(user_id: int, state: Dict[str, Any]) -> None:
+    if user_id not in _state_cache and len(_state_cache) >= _STATE_CACHE_MAX:
+        _state_cache.pop(next(iter(_state_cache)), None)
+    _state_cache.pop(user_id, None)
+    _state_cache[user_id] = (time.monotonic() + _STATE_CACHE_TTL, state)
+
+
+def _state_cache_get(user_id: int) -> Optional[Dict[str, Any]]:
+    entry = _state_cache.pop(user_id, None)
+    if entry is None:
+        return None
+    expires_at, state = entry
+    if time.monotonic() >= expires_at:
+        return None
+    _state_cache[user_id] = entry
+    return state
+
+
+# Write-behind buffer for full state writes. Rapid messages from the
+# same user coalesce into the latest (step, data_json) per user, and a
+# background task flushes the whole buffer in one transaction every
+# interval — one commit per burst instead of one per message.
+_STATE_FLUSH_INTERVAL = 0.05
+_pending_states: Dict[int, Tuple[str, str]] = {}
+_flush_task: Optional[asyncio.Task] = None
+
+
+def _ensure_flush_task() -> None:
+    """Lazily starts the background flush loop on the running event loop."""
+    global _flush_task
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.get_running_loop().create_task(_state_flush_loop())
+
+
+async def _state_flush_loop() -> None:
+    while True:
+        await asyncio.sleep(_STATE_FLUSH_INTERVAL)
+        try:
+            await flush_pending_states()
+        except Exception as e:
+            logger.error(f"Failed to flush batched state writes: {e}")
+
+
+async def flush_pending_states() -> None:
+    """Writes all buffered state rows in a single transaction."""
+    if not _pending_states:
+        return
+    rows = [(uid, step, data_json) for uid, (step, data_json) in _pending_states.items()]
+    _pending_states.clear()
+    db = await get_db()
+    async with write_lock:
+        await db.executemany(_SQL_FLUSH_STATE, rows)
+        await db.commit()
+
+
 async def get_user_state(user_id: int) -> Optional[Dict[str, Any]]:
     """
     Asynchronously retrieves the state for a given user.
 
+    Served from the in-memory cache when possible; falls back to SQLite
+    on a miss (e.g. after a process restart).
+
     Args:
         user_id: The Telegram user ID.
 
     Returns:
         A dictionary containing the user's 'step' and 'data', or None if not found.
     """
+    cached = _state_cache_get(user_id)
+    if cached is not None:
+        return cached
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute("SELECT step, data FROM user_sessions WHERE user_id = ?", (user_id,)) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    return {'step': row[0], 'data': json.loads(row[1])}
+        async with acquire_reader() as db, db.execute(_SQL_GET_STATE, (user_id,)) as cursor:
+            row = await cursor.fetchone()
+            if row:
+                state = {'step': row[0], 'data': loads(row[1])}
+                _state_cache_put(user_id, state)
+                return state
     except Exception as e:
         logger.error(f"Error getting state for user {user_id}: {e}")
     return None
@@ -96,13 +318,71 @@ async def set_user_state(user_id: int, step: str, data: Dict[str, Any]) -> None:
         step: The current step in the conversation flow.
         data: A dictionary of data to be saved for the user.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT OR REPLACE INTO user_sessions (user_id, step, data, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
-            (user_id, step, json.dumps(data, ensure_ascii=False))
-        )
+    _state_cache_put(user_id, {'step': step, 'data': data})
+    _pending_states[user_id] = (step, dumps_str(data))
+    _ensure_flush_task()
+
+async def patch_user_state(user_id: int, step: str, patch: Dict[str, Any]) -> None:
+    """
+    Applies a partial update to a user's state.
+
+    Only the changed keys are serialized and merged into the stored JSON
+    with json_patch, so the write payload scales with the size of the
+    change rather than the size of the accumulated state.
+
+    Args:
+        user_id: The Telegram user ID.
+        step: The new conversation step.
+        patch: The mutated keys and their new values.
+    """
+    state = await get_user_state(user_id)
+    if state is None:
+        # No existing row to patch; fall back to a full write.
+        await set_user_state(user_id, step, dict(patch))
+        return
+
+    state['step'] = step
+    state['data'].update(patch)
+    _state_cache_put(user_id, state)
+
+    # If a full write is still buffered, fold the patch into it instead
+    # of issuing an UPDATE that would race ahead of the unflushed INSERT.
+    if user_id in _pending_states:
+        _pending_states[user_id] = (step, dumps_str(state['data']))
+        return
+
+    db = await get_db()
+    async with write_lock:
+        await db.execute(_SQL_PATCH_STATE, (step, dumps_str(patch), user_id))
         await db.commit()
 
+
+async def append_user_photo(user_id: int, file_id: str) -> None:
+    """
+    Appends a photo file_id to the user's state without rewriting the blob.
+
+    json_set with the '[#]' subscript appends in place inside SQLite, so
+    the growing photo list is never re-serialized on the Python side. The
+    caller is expected to have already appended to the in-memory state.
+
+    Args:
+        user_id: The Telegram user ID.
+        file_id: The Telegram file_id of the new photo.
+    """
+    # A buffered full write already contains the appended photo via the
+    # caller's in-memory mutation; just refresh the buffered snapshot.
+    if user_id in _pending_states:
+        state = _state_cache_get(user_id)
+        if state is not None:
+            _pending_states[user_id] = (state['step'], dumps_str(state['data']))
+        return
+
+    db = await get_db()
+    async with write_lock:
+        await db.execute(_SQL_APPEND_PHOTO, (file_id, user_id))
+        await db.commit()
+
+
 async def clear_user_state(user_id: int) -> None:
     """
     Asynchronously clears the state for a given user.
@@ -110,8 +390,12 @@ async def clear_user_state(user_id: int) -> None:
     Args:
         user_id: The Telegram user ID.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("DELETE FROM user_sessions WHERE user_id = ?", (user_id,))
+    _state_cache.pop(user_id, None)
+    # The delete supersedes any still-buffered write for this user.
+    _pending_states.pop(user_id, None)
+    db = await get_db()
+    async with write_lock:
+        await db.execute(_SQL_CLEAR_STATE, (user_id,))
         await db.commit()
 
 # --- Submission and Listing Management ---
@@ -126,11 +410,9 @@ async def save_submission_to_db(submission_id: str, submission_type: str, data:
         data: The submission data as a dictionary.
         user_id: The ID of the user making the submission.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO submissions (submission_id, submission_type, data, user_id, created_at) VALUES (?, ?, ?, ?, ?)",
-            (submission_id, submission_type, json.dumps(data, ensure_ascii=False), user_id, datetime.now())
-        )
+    db = await get_db()
+    async with write_lock:
+        await db.execute(_SQL_ADD_SUBMISSION, (submission_id, submission_type, dumps_str(data), user_id, datetime.now()))
         await db.commit()
 
 async def get_last_submission_time(user_id: int) -> Optional[datetime]:
@@ -143,14 +425,13 @@ async def get_last_submission_time(user_id: int) -> Optional[datetime]:
     Returns:
         A datetime object of the last submission, or None if no submissions exist.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT created_at FROM submissions WHERE user_id = ? ORDER BY created_at DESC LIMIT 1", (user_id,)) as cursor:
-            row = await cursor.fetchone()
-            if row and row[0]:
-                try:
-                    return datetime.fromisoformat(row[0])
-                except (ValueError, TypeError):
-                    logger.warning(f"Could not parse date format: {row[0]}")
+    async with acquire_reader() as db, db.execute(_SQL_LAST_SUBMISSION, (user_id,)) as cursor:
+        row = await cursor.fetchone()
+        if row and row[0]:
+            try:
+                return datetime.fromisoformat(row[0])
+            except (ValueError, TypeError):
+                logger.warning(f"Could not parse date format: {row[0]}")
     return None
 
 async def add_listing(submission_id: str, listing_type: str, data: Dict[str, Any], message_id: int) -> None:
@@ -163,73 +444,113 @@ async def add_listing(submission_id: str, listing_type: str, data: Dict[str, Any
         data: The listing data as a dictionary.
         message_id: The message ID of the post in the Telegram channel.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO listings (submission_id, listing_type, data, message_id) VALUES (?, ?, ?, ?)",
-            (submission_id, listing_type, json.dumps(data, ensure_ascii=False), message_id)
-        )
+    db = await get_db()
+    async with write_lock:
+        await insert_listing(db, submission_id, listing_type, data, message_id)
         await db.commit()
 
+async def insert_listing(db: aiosqlite.Connection, submission_id: str, listing_type: str, data: Dict[str, Any], message_id: int) -> None:
+    """Inserts a listing row without committing; for use inside a wider transaction."""
+    await db.execute(_SQL_ADD_LISTING, (submission_id, listing_type, dumps_str(data), message_id))
+
 # --- Functions for Web Handlers ---
 
-async def get_all_submissions() -> Dict[str, Dict[str, Any]]:
-    """Fetches all submissions pending moderation."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT submission_id, submission_type, data FROM submissions ORDER BY created_at DESC") as cursor:
-            rows = await cursor.fetchall()
-            return {row[0]: {'type': row[1], 'data': json.loads(row[2])} for row in rows}
+async def get_all_submissions_raw() -> List[tuple]:
+    """
+    Fetches all submissions pending moderation as raw rows.
 
-async def get_rent_offer_listings() -> Dict[str, Dict[str, Any]]:
-    """Fetches all published rent offer listings."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT submission_id, listing_type, data FROM listings WHERE listing_type LIKE 'rent_offer_%'") as cursor:
-            rows = await cursor.fetchall()
-            return {row[0]: {'type': row[1], 'data': json.loads(row[2])} for row in rows}
+    Returns:
+        A list of (submission_id, submission_type, data_json) tuples, with
+        `data_json` being the stored JSON text left unparsed so callers can
+        pass it straight through to a response body.
+    """
+    async with acquire_reader() as db, db.execute(_SQL_ALL_SUBMISSIONS) as cursor:
+        return list(await cursor.fetchall())
+
+async def get_rent_offer_listings_raw() -> List[tuple]:
+    """
+    Fetches all published rent offer listings as raw rows.
+
+    Returns:
+        A list of (submission_id, listing_type, data_json) tuples with the
+        stored JSON text left unparsed.
+    """
+    async with acquire_reader() as db, db.execute(_SQL_RENT_OFFER_LISTINGS) as cursor:
+        return list(await cursor.fetchall())
 
 async def get_db_stats() -> Dict[str, int]:
-    """Fetches statistics from the database."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT COUNT(*) FROM submissions") as cursor:
-            pending_count = (await cursor.fetchone() or [0])[0]
-        async with db.execute("SELECT COUNT(*) FROM listings") as cursor:
-            active_count = (await cursor.fetchone() or [0])[0]
-        async with db.execute("SELECT COUNT(*) FROM listings WHERE date(published_at) = date('now')") as cursor:
-            today_count = (await cursor.fetchone() or [0])[0]
-        return {
-            'pending_count': pending_count,
-            'active_count': active_count,
-            'today_count': today_count
-        }
+    """Fetches statistics from the database in a single query."""
+    async with acquire_reader() as db, db.execute(_SQL_DB_STATS) as cursor:
+        row = await cursor.fetchone() or (0, 0, 0)
+    return {
+        'pending_count': row[0],
+        'active_count': row[1],
+        'today_count': row[2]
+    }
 
 async def get_submission_by_id(submission_id: str) -> Optional[Dict[str, Any]]:
     """Retrieves a single submission by its ID."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT submission_type, data FROM submissions WHERE submission_id=?", (submission_id,)) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                return {'type': row[0], 'data': json.loads(row[1])}
+    async with acquire_reader() as db, db.execute(_SQL_GET_SUBMISSION, (submission_id,)) as cursor:
+        row = await cursor.fetchone()
+        if row:
+            return {'type': row[0], 'data': loads(row[1])}
     return None
 
+async def is_file_id_public(file_id: str) -> bool:
+    """
+    Checks whether a Telegram file_id belongs to a published listing.
+
+    The file_id is searched for inside the JSON `data` blob. Matching the
+    quoted value avoids partial matches against other fields.
+    """
+    async with acquire_reader() as db, db.execute(_SQL_FILE_ID_PUBLIC, (f'%"{file_id}"%',)) as cursor:
+        return await cursor.fetchone() is not None
+
 async def delete_submission(db: aiosqlite.Connection, submission_id: str) -> None:
     """Deletes a submission from the database."""
-    await db.execute("DELETE FROM submissions WHERE submission_id=?", (submission_id,))
+    await db.execute(_SQL_DELETE_SUBMISSION, (submission_id,))
 
 async def move_submission_to_pending(db: aiosqlite.Connection, user_id: int, sub_type: str, sub_data: str) -> None:
     """Moves an approved offer to the pending_publication table."""
-    await db.execute(
-        "INSERT OR REPLACE INTO pending_publication (user_id, submission_type, data) VALUES (?, ?, ?)",
-        (user_id, sub_type, sub_data)
-    )
+    await db.execute(_SQL_MOVE_TO_PENDING, (user_id, sub_type, sub_data))
+
+async def get_cached_file_ids(file_ids: List[str]) -> Dict[str, str]:
+    """
+    Maps hunter-side file_ids to previously captured moderator-side ones.
+
+    A cached file_id can be passed to send_photo/InputMediaPhoto as a
+    plain string, so the photo is never downloaded or re-uploaded again.
+    """
+    if not file_ids:
+        return {}
+    placeholders = ','.join('?' * len(file_ids))
+    query = f"SELECT source_file_id, cached_file_id FROM file_id_cache WHERE source_file_id IN ({placeholders})"
+    async with acquire_reader() as db, db.execute(query, tuple(file_ids)) as cursor:
+        return {row[0]: row[1] for row in await cursor.fetchall()}
+
+
+async def cache_file_ids(pairs: List[Tuple[str, str]]) -> None:
+    """Persists (source_file_id, cached_file_id) mappings."""
+    if not pairs:
+        return
+    db = await get_db()
+    async with write_lock:
+        await db.executemany(_SQL_CACHE_FILE_IDS, pairs)
+        await db.commit()
+
 
 async def get_pending_publication(user_id: int) -> Optional[Dict[str, Any]]:
-    """Retrieves a pending publication for a user."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT submission_type, data FROM pending_publication WHERE user_id=?", (user_id,)) as cursor:
+    """
+    Atomically consumes a pending publication for a user.
+
+    DELETE ... RETURNING fetches and removes the row in one statement,
+    so the row cannot be processed twice and no separate SELECT is paid.
+    """
+    db = await get_db()
+    async with write_lock:
+        async with db.execute(_SQL_CONSUME_PENDING, (user_id,)) as cursor:
             row = await cursor.fetchone()
-            if row:
-                submission = {'type': row[0], 'data': json.loads(row[1])}
-                # We also need to delete it to prevent reprocessing
-                await db.execute("DELETE FROM pending_publication WHERE user_id=?", (user_id,))
-                await db.commit()
-                return submission
-    return None
\ No newline at end of file
+        await db.commit()
+    if row:
+        return {'type': row[0], 'data': loads(row[1])}
+    return None
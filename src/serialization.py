@@ -0,0 +1,37 @@
+"""
+JSON serialization helpers for the Geneva project.
+
+State rows, submissions and API payloads are (de)serialized on the event
+loop, so the native `orjson` encoder is used when available (3-10x faster
+than the stdlib on both directions). The stdlib `json` module remains as
+a fallback so the application still runs without the optional dependency.
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    # The application works without orjson, just with slower JSON handling.
+    orjson = None
+
+if orjson is not None:
+    def dumps_str(obj: Any) -> str:
+        """Serializes an object to a JSON string."""
+        return orjson.dumps(obj).decode('utf-8')
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serializes an object to JSON bytes for response bodies."""
+        return orjson.dumps(obj)
+
+    loads = orjson.loads
+else:
+    def dumps_str(obj: Any) -> str:
+        """Serializes an object to a JSON string."""
+        return json.dumps(obj, ensure_ascii=False)
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serializes an object to JSON bytes for response bodies."""
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+    loads = json.loads
@@ -0,0 +1,39 @@
+"""
+Small in-process TTL cache for API response bodies.
+
+The admin panel and public map poll the read-only API endpoints; a
+couple of seconds of staleness is acceptable there, so serving repeat
+polls from memory avoids re-running the SQLite queries and rebuilding
+the JSON payload on every request. Write paths (new submissions,
+moderation actions, publications) invalidate the affected keys.
+"""
+import hashlib
+import time
+from typing import Dict, Optional, Tuple
+
+# Default lifetime of a cached body, in seconds.
+DEFAULT_TTL = 2.0
+
+# key -> (expiry timestamp, body bytes, etag)
+_cache: Dict[str, Tuple[float, bytes, str]] = {}
+
+
+def get(key: str) -> Optional[Tuple[bytes, str]]:
+    """Returns the cached (body, etag) for a key, or None if absent/expired."""
+    entry = _cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1], entry[2]
+    return None
+
+
+def store(key: str, body: bytes, ttl: float = DEFAULT_TTL) -> str:
+    """Caches a response body under a key and returns its ETag."""
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+    _cache[key] = (time.monotonic() + ttl, body, etag)
+    return etag
+
+
+def invalidate(*keys: str) -> None:
+    """Drops the given keys from the cache."""
+    for key in keys:
+        _cache.pop(key, None)
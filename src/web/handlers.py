@@ -4,16 +4,134 @@ Request handler functions for the aiohttp web server.
 This module defines the logic for all API endpoints and for serving
 static frontend files like the admin panel and the public map.
 """
-import json
-from html import escape
-from typing import Dict, Any
+import asyncio
+import os
+import re
+import tempfile
+
+try:
+    # MarkupSafe's escape is C-implemented and noticeably faster than
+    # html.escape; the app works fine with the stdlib fallback.
+    from markupsafe import escape
+except ImportError:
+    from html import escape
 
 from aiohttp import web
 
 from src import database as db
-from src.config import logger, CHANNEL_ID, ADMIN_ID
-from src.bots.utils import hunter_bot, moderator_bot
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+from src.serialization import dumps_str, dumps_bytes, loads
+from src.config import logger, CHANNEL_ID, HUNTER_BOT_TOKEN, IMAGE_CACHE_DIR
+from src.bots.utils import hunter_bot, moderator_bot, cached_get_file, stream_telegram_file
+from src.web import cache
+
+# Caps concurrent image fetches from Telegram so browser request bursts
+# cannot exhaust the hunter bot's connection pool.
+_image_fetch_sem = asyncio.Semaphore(8)
+
+# Moderation decisions notify users over Telegram; queueing those sends
+# lets approve/reject return to the admin panel without waiting out a
+# Telegram round-trip per decision.
+_notify_queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+
+# Channel post layout for approved rent requests; built once at import
+# time, only the escaped field values change per approval.
+_RENT_REQUEST_TPL = (
+    "<b>🔍 Ищу жильё</b>\n\n"
+    "{description}\n\n"
+    "<b>👤 Автор:</b> @{author}"
+)
+
+
+def queue_user_notification(user_id: int, text: str) -> None:
+    """Schedules a Telegram message to a user without blocking the caller."""
+    if not user_id:
+        return
+    try:
+        _notify_queue.put_nowait((user_id, text))
+    except asyncio.QueueFull:
+        logger.warning(f"Notification queue is full; dropping message for user {user_id}.")
+
+
+async def notification_worker() -> None:
+    """Drains the notification queue; runs as a background task."""
+    while True:
+        user_id, text = await _notify_queue.get()
+        try:
+            await moderator_bot.send_message(user_id, text)
+        except Exception as e:
+            logger.warning(f"Failed to notify user {user_id}: {e}")
+        finally:
+            _notify_queue.task_done()
+
+# Telegram file_ids are base64url-like tokens; anything else is rejected
+# before the value is ever used as part of a cache file name.
+_FILE_ID_RE = re.compile(r'[A-Za-z0-9_-]+')
+
+# Telegram file contents are immutable for a given file_id, so cached
+# images can be served with a far-future lifetime.
+_IMAGE_CACHE_HEADERS = {'Cache-Control': 'public, max-age=31536000, immutable'}
+
+
+def _image_cache_path(file_id: str) -> str:
+    return os.path.join(IMAGE_CACHE_DIR, f"{file_id}.jpg")
+
+
+def _open_image_cache_tmp(path: str):
+    """
+    Opens a uniquely named temp file in the cache directory, or None if
+    that fails. A unique name per request means two concurrent misses
+    for the same file_id each write their own file; whichever finishes
+    first wins the atomic rename, and neither can corrupt the other.
+    """
+    try:
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=IMAGE_CACHE_DIR, suffix='.tmp', delete=False)
+    except OSError as e:
+        logger.warning(f"Could not open image cache file for {path}: {e}")
+        return None
+
+
+def _promote_image_cache(tmp_file, path: str) -> None:
+    """Promotes a fully written temp file to the cache path; runs in a thread."""
+    tmp_file.close()
+    os.replace(tmp_file.name, path)
+
+
+def _discard_image_cache(tmp_file) -> None:
+    """Closes and removes an abandoned temp file; runs in a thread."""
+    tmp_file.close()
+    try:
+        os.remove(tmp_file.name)
+    except OSError:
+        pass
+
+
+def _cached_json_response(request: web.Request, body: bytes, etag: str) -> web.Response:
+    """
+    Builds a JSON response with caching headers for the polling endpoints.
+
+    The ETag is derived from the body content, so when a polling client
+    presents it back via If-None-Match and the data has not changed, the
+    payload is replaced by an empty 304 — the admin panel and public map
+    poll these endpoints, and most polls see no change.
+    """
+    headers = {'Cache-Control': f'max-age={int(cache.DEFAULT_TTL)}', 'ETag': etag}
+    if request.headers.get('If-None-Match') == etag:
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=body, content_type='application/json', headers=headers)
+
+
+def _rows_to_json_body(rows) -> bytes:
+    """
+    Builds a `{submission_id: {"type": ..., "data": ...}}` JSON body from
+    raw database rows, splicing the stored JSON text in directly instead
+    of parsing and re-serializing every `data` blob.
+    """
+    parts = [
+        '%s:{"type":%s,"data":%s}' % (dumps_str(sid), dumps_str(row_type), data_json)
+        for sid, row_type, data_json in rows
+    ]
+    return ('{' + ','.join(parts) + '}').encode('utf-8')
 
 # --- API Handlers ---
 
@@ -27,8 +145,13 @@ async def get_stats(request: web.Request) -> web.Response:
         A JSON response with the statistics.
     """
     try:
+        cached = cache.get('stats')
+        if cached:
+            return _cached_json_response(request, *cached)
         stats = await db.get_db_stats()
-        return web.json_response(stats)
+        body = dumps_bytes(stats)
+        etag = cache.store('stats', body)
+        return _cached_json_response(request, body, etag)
     except Exception as e:
         logger.exception(f"API Error at /api/stats: {e}")
         return web.json_response({'status': 'error', 'message': 'Internal Server Error'}, status=500)
@@ -41,8 +164,13 @@ async def get_submissions(request: web.Request) -> web.Response:
         A JSON response containing a dictionary of submission objects.
     """
     try:
-        submissions = await db.get_all_submissions()
-        return web.json_response(submissions)
+        cached = cache.get('submissions')
+        if cached:
+            return _cached_json_response(request, *cached)
+        rows = await db.get_all_submissions_raw()
+        body = _rows_to_json_body(rows)
+        etag = cache.store('submissions', body)
+        return _cached_json_response(request, body, etag)
     except Exception as e:
         logger.exception(f"API Error at /api/submissions: {e}")
         return web.json_response({'status': 'error', 'message': 'Internal Server Error'}, status=500)
@@ -55,52 +183,77 @@ async def get_listings(request: web.Request) -> web.Response:
         A JSON response containing a dictionary of listing objects.
     """
     try:
-        listings = await db.get_rent_offer_listings()
-        return web.json_response(listings)
+        cached = cache.get('listings')
+        if cached:
+            return _cached_json_response(request, *cached)
+        rows = await db.get_rent_offer_listings_raw()
+        body = _rows_to_json_body(rows)
+        etag = cache.store('listings', body)
+        return _cached_json_response(request, body, etag)
     except Exception as e:
         logger.exception(f"API Error at /api/listings: {e}")
         return web.json_response({'status': 'error', 'message': 'Internal Server Error'}, status=500)
 
 async def get_image(request: web.Request) -> web.Response:
-    """
-    Serves an image from Telegram by its file_id.
-
-    The file_id is extracted from the request URL.
-
-    Returns:
-        A web.Response with the image content and JPEG content type.
-    """
-    file_id = request.match_info.get('file_id')
-    if not file_id:
-        return web.Response(status=404, text="File ID is missing.")
-async def get_image(request):
     """Отдает файл изображения по его file_id, только если он принадлежит опубликованному объявлению."""
     file_id = request.match_info.get('file_id')
-    if not file_id:
+    if not file_id or not _FILE_ID_RE.fullmatch(file_id):
         return web.Response(status=404)
 
+    resp = None
     try:
         # Проверяем, существует ли объявление с таким file_id
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Ищем file_id внутри JSON-поля data.
-            # Это не самый эффективный способ, но для SQLite и текущей задачи он подходит.
-            # Мы ищем точное совпадение file_id в кавычках, чтобы избежать частичных совпадений.
-            query = "SELECT 1 FROM listings WHERE data LIKE ?"
-            cursor = await db.execute(query, (f'%"{file_id}"%',))
-            is_public = await cursor.fetchone()
-
-        if not is_public:
+        if not await db.is_file_id_public(file_id):
             logger.warning(f"Попытка доступа к непубличному изображению: {file_id}")
             return web.Response(status=404, text="Image not found or not public")
 
-        # Если проверка пройдена, скачиваем и отдаем файл
-        file_info = await hunter_bot.get_file(file_id)
-        # The file path from get_file is temporary, so we must download it immediately
-        file_content = await hunter_bot.download_file(file_info.file_path)
-        return web.Response(body=file_content, content_type='image/jpeg')
+        # Telegram file_ids are immutable, so a disk cache hit spares both
+        # the Bot API round-trip and the image bytes transfer.
+        cache_path = _image_cache_path(file_id)
+        if await asyncio.to_thread(os.path.exists, cache_path):
+            return web.FileResponse(cache_path, headers=_IMAGE_CACHE_HEADERS)
+
+        # Если проверка пройдена, транслируем файл клиенту по частям:
+        # в памяти находится не весь снимок, а только текущий 64-КиБ кусок.
+        async with _image_fetch_sem:
+            file_path = await cached_get_file(hunter_bot, file_id)
+
+            resp = web.StreamResponse(
+                headers={'Content-Type': 'image/jpeg', **_IMAGE_CACHE_HEADERS}
+            )
+            await resp.prepare(request)
+
+            # Tee the stream into the disk cache while relaying it; the
+            # temp file is promoted atomically only after a full download.
+            # All the blocking file I/O runs in worker threads so the
+            # event loop never waits on the disk.
+            tmp_file = await asyncio.to_thread(_open_image_cache_tmp, cache_path)
+            try:
+                async for chunk in stream_telegram_file(HUNTER_BOT_TOKEN, file_path):
+                    await resp.write(chunk)
+                    if tmp_file is not None:
+                        await asyncio.to_thread(tmp_file.write, chunk)
+                if tmp_file is not None:
+                    try:
+                        await asyncio.to_thread(_promote_image_cache, tmp_file, cache_path)
+                    except OSError as e:
+                        logger.warning(f"Could not cache image {file_id} on disk: {e}")
+                    tmp_file = None
+            except Exception:
+                if tmp_file is not None:
+                    await asyncio.to_thread(_discard_image_cache, tmp_file)
+                    tmp_file = None
+                raise
+
+        await resp.write_eof()
+        return resp
 
     except Exception as e:
         logger.error(f"Error fetching image for file_id {file_id}: {e}")
+        # Once streaming has begun the status line is already on the wire;
+        # all that can be done is to end the (truncated) response.
+        if resp is not None and resp.prepared:
+            return resp
         return web.Response(status=500, text="Error retrieving image.")
 
 async def approve_submission(request: web.Request) -> web.Response:
@@ -115,34 +268,66 @@ async def approve_submission(request: web.Request) -> web.Response:
 
         logger.info(f"Received APPROVE command for submission ID: {submission_id}")
 
-        async with db.aiosqlite.connect(db.DB_PATH) as conn:
-            # Use a transaction to ensure atomicity
-            async with conn.begin():
-                cursor = await conn.execute("SELECT submission_type, data FROM submissions WHERE submission_id=?", (submission_id,))
+        conn = await db.get_db()
+        # First transaction: claim the submission. The write lock
+        # serializes every writer in the process, so nothing slower than
+        # SQLite itself may run while it is held — in particular no
+        # Telegram round-trip.
+        async with db.write_lock:
+            # BEGIN IMMEDIATE takes the write lock up front, and RETURNING
+            # fuses the previous SELECT + DELETE pair into one statement.
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                # The author lives in the user_id column, so the data
+                # blob does not have to be parsed just to reach it.
+                cursor = await conn.execute(
+                    "DELETE FROM submissions WHERE submission_id=? RETURNING submission_type, data, user_id, created_at",
+                    (submission_id,)
+                )
                 row = await cursor.fetchone()
 
                 if not row:
+                    await conn.rollback()
                     logger.warning(f"Submission {submission_id} not found for approval.")
                     return web.json_response({'status': 'error', 'message': 'Submission not found'}, status=404)
 
-                sub_type, sub_data_json = row
-                sub_data = json.loads(sub_data_json)
-                user_id = sub_data.get('author_id')
-
-                await db.delete_submission(conn, submission_id)
+                sub_type, sub_data_json, user_id, created_at = row
 
                 if sub_type.startswith('rent_offer'):
                     await db.move_submission_to_pending(conn, user_id, sub_type, sub_data_json)
-                    await moderator_bot.send_message(user_id, "🎉 Ваше объявление одобрено! Остался последний шаг: пожалуйста, пришлите точный адрес объекта (Город, Улица, Дом), чтобы мы могли добавить его на карту.")
-
-                elif sub_type == 'rent_request':
-                    text = (f"<b>🔍 Ищу жильё</b>\n\n"
-                            f"{escape(sub_data.get('description'))}\n\n"
-                            f"<b>👤 Автор:</b> @{escape(sub_data.get('author_username') or 'скрыт')}")
-                    msg = await moderator_bot.send_message(CHANNEL_ID, text)
-                    await db.add_listing(submission_id, sub_type, sub_data, msg.message_id)
-                    await moderator_bot.send_message(user_id, "Ваша заявка на поиск одобрена и опубликована в канале!")
-
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+
+        if sub_type.startswith('rent_offer'):
+            queue_user_notification(user_id, "🎉 Ваше объявление одобрено! Остался последний шаг: пожалуйста, пришлите точный адрес объекта (Город, Улица, Дом), чтобы мы могли добавить его на карту.")
+
+        elif sub_type == 'rent_request':
+            sub_data = loads(sub_data_json)
+            text = _RENT_REQUEST_TPL.format(
+                description=escape(sub_data.get('description')),
+                author=escape(sub_data.get('author_username') or 'скрыт'),
+            )
+            try:
+                msg = await moderator_bot.send_message(CHANNEL_ID, text)
+            except Exception:
+                # The channel post failed after the row was claimed; put
+                # the submission back so the approval can be retried.
+                async with db.write_lock:
+                    await conn.execute(
+                        "INSERT OR IGNORE INTO submissions (submission_id, submission_type, data, user_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (submission_id, sub_type, sub_data_json, user_id, created_at)
+                    )
+                    await conn.commit()
+                raise
+            # Follow-up transaction records the published listing.
+            async with db.write_lock:
+                await db.insert_listing(conn, submission_id, sub_type, sub_data, msg.message_id)
+                await conn.commit()
+            queue_user_notification(user_id, "Ваша заявка на поиск одобрена и опубликована в канале!")
+
+        cache.invalidate('stats', 'submissions', 'listings')
         logger.info(f"Submission {submission_id} approved successfully.")
         return web.json_response({'status': 'ok'})
 
@@ -163,21 +348,23 @@ async def reject_submission(request: web.Request) -> web.Response:
 
         logger.info(f"Received REJECT command for ID: {submission_id} with reason: {reason}")
 
-        async with db.aiosqlite.connect(db.DB_PATH) as conn:
-            cursor = await conn.execute("SELECT data FROM submissions WHERE submission_id=?", (submission_id,))
+        conn = await db.get_db()
+        async with db.write_lock:
+            cursor = await conn.execute(
+                "DELETE FROM submissions WHERE submission_id=? RETURNING user_id",
+                (submission_id,)
+            )
             row = await cursor.fetchone()
             if not row:
+                await conn.rollback()
                 return web.json_response({'status': 'error', 'message': 'Submission not found'}, status=404)
 
-            user_id = json.loads(row[0]).get('author_id')
-            await db.delete_submission(conn, submission_id)
+            user_id = row[0]
             await conn.commit()
 
-        if user_id:
-            try:
-                await moderator_bot.send_message(user_id, f"К сожалению, ваша заявка была отклонена модератором.\n\n<i>Причина: {escape(reason)}</i>")
-            except Exception as e:
-                logger.warning(f"Failed to notify user {user_id} of rejection: {e}")
+        cache.invalidate('stats', 'submissions')
+
+        queue_user_notification(user_id, f"К сожалению, ваша заявка была отклонена модератором.\n\n<i>Причина: {escape(reason)}</i>")
 
         logger.info(f"Submission {submission_id} successfully rejected.")
         return web.json_response({'status': 'ok'})
@@ -188,10 +375,16 @@ async def reject_submission(request: web.Request) -> web.Response:
 
 # --- Static File Handlers ---
 
+# The HTML shells change only on deploy; a short browser cache plus the
+# Last-Modified/ETag conditional GET that FileResponse already performs
+# keeps repeat page loads from re-transferring the body.
+_STATIC_HTML_HEADERS = {'Cache-Control': 'public, max-age=300'}
+
+
 async def serve_admin_panel(request: web.Request) -> web.FileResponse:
     """Serves the admin_panel.html file."""
-    return web.FileResponse('./admin_panel.html')
+    return web.FileResponse('./admin_panel.html', headers=_STATIC_HTML_HEADERS)
 
 async def serve_public_map(request: web.Request) -> web.FileResponse:
     """Serves the public_map.html file."""
-    return web.FileResponse('./public_map.html')
\ No newline at end of file
+    return web.FileResponse('./public_map.html', headers=_STATIC_HTML_HEADERS)
\ No newline at end of file
@@ -1,44 +1,104 @@
 """
 Middleware for the aiohttp web application.
 
-This module provides middleware functions for centralized request logging
-and robust error handling.
+This module provides a single middleware combining request logging and
+error handling. One middleware instead of two halves the per-request
+await hops, and the Telegram webhook path is passed straight through to
+its handler so the per-message critical route carries no middleware
+overhead at all.
 """
+import hmac
 import logging
-from typing import Awaitable, Callable
+import time
+from typing import Awaitable, Callable, Dict, Tuple
 from aiohttp import web
 from aiohttp.web_request import Request
 from aiohttp.web_response import Response
 
+from src.config import ADMIN_API_TOKEN
+
 logger = logging.getLogger(__name__)
 
-@web.middleware
-async def logging_middleware(request: Request, handler: Callable[[Request], Awaitable[Response]]) -> Response:
-    """
-    Logs information about each incoming request.
-    """
-    logger.info(
-        f"Request: {request.method} {request.path} from {request.remote}"
+# Telegram webhook routes; updates arrive here, so this is the hot path.
+_WEBHOOK_PREFIX = '/tg/'
+
+# Moderation endpoints: bearer-token protected (when ADMIN_API_TOKEN is
+# set) and rate-limited, so unauthorized or flooding POSTs are rejected
+# here instead of consuming database time.
+_PROTECTED_PATHS = frozenset({'/api/approve', '/api/reject'})
+
+# Token bucket per client IP: up to _BUCKET_CAPACITY actions at once,
+# refilled at _BUCKET_RATE per second. Moderation is a human clicking
+# buttons, so generous limits still stop scripted floods. The table is
+# capped so clients cycling source addresses cannot grow it without
+# bound; when full, the least recently seen bucket is evicted.
+_BUCKET_CAPACITY = 20.0
+_BUCKET_RATE = 2.0
+_BUCKET_MAX = 10_000
+_buckets: Dict[str, Tuple[float, float]] = {}
+
+if not ADMIN_API_TOKEN:
+    logger.warning(
+        "ADMIN_API_TOKEN is not set; the moderation API is not protected by authentication."
     )
-    return await handler(request)
+
+
+def _authorized(request: Request) -> bool:
+    """Checks the Authorization header against the configured token."""
+    if not ADMIN_API_TOKEN:
+        return True
+    supplied = request.headers.get('Authorization', '')
+    return hmac.compare_digest(supplied, f"Bearer {ADMIN_API_TOKEN}")
+
+
+def _rate_limited(remote: str) -> bool:
+    """Takes one token from the client's bucket; True when it is empty."""
+    now = time.monotonic()
+    # pop + reinsert keeps the dict ordered by last use, so eviction
+    # drops the least recently seen client (as in the DB state cache).
+    entry = _buckets.pop(remote, None)
+    if entry is None and len(_buckets) >= _BUCKET_MAX:
+        _buckets.pop(next(iter(_buckets)), None)
+    tokens, last = entry if entry is not None else (_BUCKET_CAPACITY, now)
+    tokens = min(_BUCKET_CAPACITY, tokens + (now - last) * _BUCKET_RATE)
+    if tokens < 1.0:
+        _buckets[remote] = (tokens, now)
+        return True
+    _buckets[remote] = (tokens - 1.0, now)
+    return False
+
 
 @web.middleware
-async def error_handling_middleware(request: Request, handler: Callable[[Request], Awaitable[Response]]) -> Response:
+async def request_middleware(request: Request, handler: Callable[[Request], Awaitable[Response]]) -> Response:
     """
-    Catches exceptions and returns a standardized JSON error response.
-
-    This prevents stack traces from being leaked to the client and ensures
-    a consistent error format for the API.
+    Logs each incoming request, guards the moderation endpoints, and
+    converts unhandled exceptions into a standardized JSON error
+    response, preventing stack traces from being leaked to the client.
+    Webhook requests skip all of it to keep the update-dispatch path as
+    thin as possible.
     """
+    if request.path.startswith(_WEBHOOK_PREFIX):
+        return await handler(request)
+
+    if request.path in _PROTECTED_PATHS:
+        if not _authorized(request):
+            logger.warning(f"Unauthorized {request.method} {request.path} from {request.remote}")
+            return web.json_response({'status': 'error', 'message': 'Unauthorized'}, status=401)
+        if _rate_limited(request.remote or ''):
+            return web.json_response({'status': 'error', 'message': 'Too Many Requests'}, status=429)
+
+    # Lazy %-formatting: when INFO is filtered out, no string is built.
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Request: %s %s from %s", request.method, request.path, request.remote)
     try:
         return await handler(request)
-    except web.HTTPException as ex:
+    except web.HTTPException:
         # HTTP exceptions are already proper responses, so re-raise them
-        raise ex
-    except Exception as e:
+        raise
+    except Exception:
         # For all other exceptions, log the full error and return a generic 500 response
-        logger.exception(f"Unhandled exception for request {request.method} {request.path}: {e}")
+        logger.exception("Unhandled exception for request %s %s", request.method, request.path)
         return web.json_response(
             {'status': 'error', 'message': 'Internal Server Error'},
             status=500
-        )
\ No newline at end of file
+        )
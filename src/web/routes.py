@@ -6,6 +6,7 @@ request handler functions defined in `src.web.handlers`.
 """
 from aiohttp import web
 from . import handlers
+from .webhooks import setup_webhook_routes
 
 def setup_routes(app: web.Application) -> None:
     """
@@ -26,4 +27,7 @@ def setup_routes(app: web.Application) -> None:
     # Routes for serving the frontend HTML pages
     app.router.add_get('/admin', handlers.serve_admin_panel)
     app.router.add_get('/', handlers.serve_public_map)
-    app.router.add_get('/map', handlers.serve_public_map)
\ No newline at end of file
+    app.router.add_get('/map', handlers.serve_public_map)
+
+    # Telegram webhook endpoints (used when not running in polling mode)
+    setup_webhook_routes(app)
\ No newline at end of file
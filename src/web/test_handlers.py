@@ -1,71 +1,100 @@
 import os
+import shutil
+import tempfile
 import unittest
 from unittest.mock import AsyncMock, patch, MagicMock
 
-from aiohttp.test_utils import AioHTTPTestCase, unittest_run_loop
+from aiohttp.test_utils import AioHTTPTestCase
 from aiohttp import web
 
 # We need to import setup_routes to build the app, which in turn imports the handlers.
 # Patching needs to happen on the objects as they are seen by the handlers module.
 from src.web.routes import setup_routes
+from src.web import middleware
+from src.web.middleware import request_middleware
 
-# Define mock objects for bot functions to return
-mock_file_info = MagicMock()
-mock_file_info.file_path = "some/mock/path"
-mock_file_content = b"test_image_content"
+# Define mock objects for the file-fetching helpers the handler uses.
+mock_file_path = "some/mock/path"
+mock_file_chunks = [b"test_image_", b"content"]
+mock_file_content = b"".join(mock_file_chunks)
 
 # Create a mock bot object. This will be used to replace the real bot.
-# Its async methods need to be AsyncMocks.
 mock_hunter_bot = MagicMock()
-mock_hunter_bot.get_file = AsyncMock(return_value=mock_file_info)
-mock_hunter_bot.download_file = AsyncMock(return_value=mock_file_content)
+
+# cached_get_file resolves the file_id to a Bot API file_path.
+mock_cached_get_file = AsyncMock(return_value=mock_file_path)
+
+
+async def _fake_stream(token, file_path, chunk_size=65536):
+    """Stands in for stream_telegram_file: yields the mock image in chunks."""
+    for chunk in mock_file_chunks:
+        yield chunk
+
+
+mock_stream = MagicMock(side_effect=_fake_stream)
+
+# The database helper that checks whether a file_id belongs to a
+# published listing, mocked so no real database is touched.
+mock_is_public = AsyncMock()
 
 class TestGetImageHandler(AioHTTPTestCase):
     """Tests the get_image handler with proper, isolated mocking."""
 
+    @classmethod
+    def setUpClass(cls):
+        """Starts the patchers once; per-test state is reset in setUp."""
+        super().setUpClass()
+
+        # Patch the bot and the file-fetching helpers directly in the
+        # handlers module where they are used. The patchers are
+        # class-scoped: starting and stopping them per test bought no
+        # isolation the reset_mock calls do not already provide.
+        cls.patchers = [
+            patch('src.web.handlers.hunter_bot', mock_hunter_bot),
+            patch('src.web.handlers.cached_get_file', mock_cached_get_file),
+            patch('src.web.handlers.stream_telegram_file', mock_stream),
+            patch('src.web.handlers.db.is_file_id_public', mock_is_public),
+        ]
+
+        # Point the image disk cache at a throwaway directory so cached
+        # files cannot leak between runs; tests use distinct file_ids.
+        cls.image_cache_dir = tempfile.mkdtemp()
+        cls.patchers.append(
+            patch('src.web.handlers.IMAGE_CACHE_DIR', cls.image_cache_dir)
+        )
+
+        for patcher in cls.patchers:
+            patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stops all patchers and removes the temporary cache directory."""
+        super().tearDownClass()
+        for patcher in cls.patchers:
+            patcher.stop()
+        shutil.rmtree(cls.image_cache_dir, ignore_errors=True)
+
     async def get_application(self):
         """Creates the aiohttp test application."""
         app = web.Application()
-        # The handlers are registered here. The patches will already be active
+        # The handlers are registered here. The patches are already active
         # when the test methods run and call the handlers.
         setup_routes(app)
         return app
 
     def setUp(self):
-        """Set up mocks before each test method."""
+        """Resets the shared mocks to ensure test isolation."""
         super().setUp()
+        mock_cached_get_file.reset_mock()
+        mock_stream.reset_mock()
+        mock_is_public.reset_mock()
 
-        # Reset mocks to ensure test isolation
-        mock_hunter_bot.get_file.reset_mock()
-        mock_hunter_bot.download_file.reset_mock()
-
-        # Patch the bot directly in the handlers module where it's used.
-        # This is the crucial fix.
-        self.hunter_patcher = patch('src.web.handlers.hunter_bot', mock_hunter_bot)
-        self.hunter_patcher.start()
-
-        # Patch the database connection within the handlers module.
-        self.db_patcher = patch('src.web.handlers.aiosqlite.connect')
-        self.mock_db_connect = self.db_patcher.start()
-
-        # Configure the mock database to return a mock connection and cursor.
-        self.mock_db_conn = AsyncMock()
-        self.mock_db_cursor = AsyncMock()
-        self.mock_db_connect.return_value.__aenter__.return_value = self.mock_db_conn
-        self.mock_db_conn.execute.return_value = self.mock_db_cursor
-
-    def tearDown(self):
-        """Clean up and stop all patchers after each test."""
-        super().tearDown()
-        patch.stopall() # this will stop hunter_patcher and db_patcher
-
-    @unittest_run_loop
     async def test_get_image_for_public_listing(self):
         """Test: Image for a public listing should be returned successfully."""
         public_file_id = "file_id_public_123"
 
         # Simulate that the database found a public listing with this file_id.
-        self.mock_db_cursor.fetchone.return_value = (1,)
+        mock_is_public.return_value = True
 
         resp = await self.client.request("GET", f"/api/image/{public_file_id}")
 
@@ -74,36 +103,78 @@ class TestGetImageHandler(AioHTTPTestCase):
         self.assertEqual(content, mock_file_content)
 
         # Verify that the database was checked.
-        self.mock_db_conn.execute.assert_called_once_with(
-            "SELECT 1 FROM listings WHERE data LIKE ?", (f'%"{public_file_id}"%',)
-        )
-        # Verify that the bot was called to download the file.
-        mock_hunter_bot.get_file.assert_called_once_with(public_file_id)
-        mock_hunter_bot.download_file.assert_called_once_with(mock_file_info.file_path)
+        mock_is_public.assert_awaited_once_with(public_file_id)
+        # Verify that the file_id was resolved and the body streamed.
+        mock_cached_get_file.assert_awaited_once_with(mock_hunter_bot, public_file_id)
+        mock_stream.assert_called_once()
+        self.assertEqual(mock_stream.call_args.args[1], mock_file_path)
 
-    @unittest_run_loop
     async def test_get_image_for_private_submission(self):
         """Test: Image for a private/non-existent listing should be rejected."""
         private_file_id = "file_id_private_456"
 
         # Simulate that the database did NOT find any public listing.
-        self.mock_db_cursor.fetchone.return_value = None
+        mock_is_public.return_value = False
 
         resp = await self.client.request("GET", f"/api/image/{private_file_id}")
 
         self.assertEqual(resp.status, 404)
 
         # Verify that the database was checked.
-        self.mock_db_conn.execute.assert_called_once_with(
-            "SELECT 1 FROM listings WHERE data LIKE ?", (f'%"{private_file_id}"%',)
-        )
-        # Verify that the bot was NOT called, preventing the data leak.
-        mock_hunter_bot.get_file.assert_not_called()
-        mock_hunter_bot.download_file.assert_not_called()
+        mock_is_public.assert_awaited_once_with(private_file_id)
+        # Verify that nothing was fetched, preventing the data leak.
+        mock_cached_get_file.assert_not_called()
+        mock_stream.assert_not_called()
+
+class TestModerationApiGuard(AioHTTPTestCase):
+    """Tests the auth and rate-limit guard on the moderation endpoints."""
+
+    async def get_application(self):
+        """Builds an app with the middleware and a stub protected handler."""
+        app = web.Application(middlewares=[request_middleware])
+
+        async def ok(request):
+            return web.json_response({'status': 'ok'})
+
+        app.router.add_post('/api/reject', ok)
+        return app
+
+    def setUp(self):
+        """Configures a token and empties the rate-limit buckets."""
+        super().setUp()
+        token_patcher = patch('src.web.middleware.ADMIN_API_TOKEN', 'test-token')
+        token_patcher.start()
+        self.addCleanup(token_patcher.stop)
+        middleware._buckets.clear()
+
+    async def test_requests_without_valid_token_are_rejected(self):
+        """Test: missing and wrong bearer tokens never reach the handler."""
+        resp = await self.client.post('/api/reject')
+        self.assertEqual(resp.status, 401)
+
+        resp = await self.client.post('/api/reject', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(resp.status, 401)
+
+    async def test_authorized_request_passes(self):
+        """Test: the configured token reaches the handler."""
+        resp = await self.client.post('/api/reject', headers={'Authorization': 'Bearer test-token'})
+        self.assertEqual(resp.status, 200)
+
+    async def test_flood_is_rate_limited(self):
+        """Test: an authorized burst beyond the bucket capacity gets 429."""
+        headers = {'Authorization': 'Bearer test-token'}
+        with patch('src.web.middleware._BUCKET_CAPACITY', 3.0), \
+             patch('src.web.middleware._BUCKET_RATE', 0.0):
+            statuses = []
+            for _ in range(5):
+                resp = await self.client.post('/api/reject', headers=headers)
+                statuses.append(resp.status)
+        self.assertEqual(statuses, [200, 200, 200, 429, 429])
+
 
 if __name__ == "__main__":
     os.environ['MODERATOR_BOT_TOKEN'] = 'dummy_token'
     os.environ['HUNTER_BOT_TOKEN'] = 'dummy_token'
     os.environ['CHANNEL_ID'] = 'dummy_channel'
     os.environ['ADMIN_ID'] = 'dummy_admin'
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Webhook endpoints for receiving Telegram updates.
+
+Instead of long-polling the Bot API, Telegram POSTs each update to a
+per-bot route on the existing aiohttp server, which removes the idle
+polling round-trips and lets updates be dispatched concurrently. The
+webhook paths embed a secret derived from the bot token so third
+parties cannot inject updates.
+"""
+import hashlib
+
+from aiohttp import web
+from telebot import types
+
+from src.bots.utils import hunter_bot, moderator_bot
+from src.config import HUNTER_BOT_TOKEN, MODERATOR_BOT_TOKEN, DOMAIN_NAME, logger
+
+
+def _webhook_secret(token: str) -> str:
+    """Derives a stable, non-guessable URL segment from a bot token."""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+HUNTER_WEBHOOK_PATH = f"/tg/hunter/{_webhook_secret(HUNTER_BOT_TOKEN or '')}"
+MODERATOR_WEBHOOK_PATH = f"/tg/moderator/{_webhook_secret(MODERATOR_BOT_TOKEN or '')}"
+
+
+def use_webhooks() -> bool:
+    """
+    Tells whether the bots should run in webhook mode.
+
+    Telegram can only deliver webhooks to a public HTTPS host, so local
+    development (the default DOMAIN_NAME) keeps the polling transport.
+    """
+    return DOMAIN_NAME not in ('', 'localhost', '127.0.0.1')
+
+
+async def _handle_update(bot, request: web.Request) -> web.Response:
+    """Parses one Telegram update from the request body and dispatches it."""
+    try:
+        update = types.Update.de_json(await request.json())
+    except Exception as e:
+        logger.warning(f"Discarding malformed webhook payload: {e}")
+        return web.Response(status=400)
+    await bot.process_new_updates([update])
+    return web.Response()
+
+
+async def hunter_webhook(request: web.Request) -> web.Response:
+    """Receives updates for the Hunter bot."""
+    return await _handle_update(hunter_bot, request)
+
+
+async def moderator_webhook(request: web.Request) -> web.Response:
+    """Receives updates for the Moderator bot."""
+    return await _handle_update(moderator_bot, request)
+
+
+def setup_webhook_routes(app: web.Application) -> None:
+    """Registers the Telegram webhook routes on the application."""
+    app.router.add_post(HUNTER_WEBHOOK_PATH, hunter_webhook)
+    app.router.add_post(MODERATOR_WEBHOOK_PATH, moderator_webhook)